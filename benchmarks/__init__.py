@@ -0,0 +1,6 @@
+"""Benchmarks of the overhead of the accepts and returns decorators.
+Run them with
+    python -m benchmarks --output results.json
+and compare two runs with
+    python -m benchmarks --compare old.json new.json
+"""
@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+from benchmarks.decorators import SIZES, run, compare
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure the overhead of the typechecker decorators")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="sizes of the containers")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="measures per case, the best one is kept")
+    parser.add_argument("--filter", nargs="+", default=None,
+                        help="only run the cases starting with these names")
+    parser.add_argument("--output", default=None,
+                        help="JSON file to write the results to (default : "
+                             "standard output)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two JSON results instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print("{:40s} {:>14s} {:>14s} {:>8s}".format("case", "old (ns)",
+                                                    "new (ns)", "ratio"))
+        for name, before, after, ratio in compare(old, new):
+            print("{:40s} {:14.0f} {:14.0f} {:8.2f}".format(name, before,
+                                                           after, ratio))
+        return
+
+    results = run(tuple(args.sizes), args.repeat, args.filter)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        for result in results["results"]:
+            print("{:40s} {:14.0f} ns/call {:10.2f} ns/element".format(
+                    result["name"], result["overhead_ns"],
+                    result["overhead_ns_per_element"]))
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Measure the cost of the accepts and returns decorators for various type
+shapes and container sizes. Each case is timed once decorated and once
+undecorated, the difference being the overhead of the check. The lists of
+records are also checked with typechecker.batch.validate_batch, and the
+large containers in parallel with threads and with processes (see
+typechecker.typecheck.set_parallel).
+"""
+import platform
+import sys
+import time
+import timeit
+import typing
+from typing import List, Tuple, Dict, Set, Any, Union
+
+from typechecker.batch import validate_batch
+from typechecker.typecheck import accepts, returns, set_parallel
+
+SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+# Minimum number of elements of the containers checked in parallel
+PARALLEL_THRESHOLD = 100000
+
+def _identity(arg):
+    return arg
+
+def _batch(typ):
+    """Build a function checking its argument with validate_batch, like the
+    decorators check a list of records.
+    Parameters:
+        typ - typing._GenericAlias:
+            The type of the list of records
+    Returns:
+        function:
+            The function, returning its argument
+    """
+    schema = typing.get_args(typ)[0]
+    def validate(arg):
+        validate_batch(arg, schema)
+        return arg
+    return validate
+
+def _nested_tuple(depth):
+    """Build a type Tuple[int, Tuple[int, ...]] nested 'depth' times, and a
+    value of this type.
+    Parameters:
+        depth - int:
+            The number of nested tuples
+    Returns:
+        tuple:
+            The type, the value and the number of elements of the value
+    """
+    typ, value = int, 1
+    for i in range(depth):
+        typ, value = Tuple[int, typ], (1, value)
+    return typ, value, 2 * depth + 1
+
+def _nested_dict(depth):
+    """Build a type Dict[str, Dict[str, ...]] nested 'depth' times, and a
+    value of this type.
+    Parameters:
+        depth - int:
+            The number of nested dicts
+    Returns:
+        tuple:
+            The type, the value and the number of elements of the value
+    """
+    typ, value = int, 1
+    for i in range(depth):
+        typ, value = Dict[str, typ], {"a": value}
+    return typ, value, 2 * depth + 1
+
+def get_cases(sizes=SIZES):
+    """Build the benchmark cases.
+    Parameters:
+        sizes - tuple[int]:
+            The sizes of the containers
+    Returns:
+        list[tuple]:
+            A list of (name, type, value, number of elements) tuples
+    """
+    cases = [("scalar", int, 1, 1),
+             ("union", Union[int, str], "a", 1),
+             ("any", Any, 1, 1)]
+    for depth in (2, 8):
+        typ, value, count = _nested_tuple(depth)
+        cases.append(("tuple_depth_" + str(depth), typ, value, count))
+        typ, value, count = _nested_dict(depth)
+        cases.append(("dict_depth_" + str(depth), typ, value, count))
+    for size in sizes:
+        cases.append(("list_int_" + str(size), List[int],
+                      list(range(size)), size))
+        cases.append(("set_int_" + str(size), Set[int],
+                      set(range(size)), size))
+        cases.append(("dict_str_int_" + str(size), Dict[str, int],
+                      {str(i): i for i in range(size)}, 2 * size))
+        cases.append(("list_tuple_" + str(size), List[Tuple[str, float]],
+                      [("a", 1.5)] * size, 3 * size))
+        cases.append(("list_dict_" + str(size), List[Dict[str, int]],
+                      [{"a": 1, "b": 2}] * size, 5 * size))
+    return cases
+
+def _time(f, value, repeat):
+    """Time a call of 'f' on 'value'.
+    Parameters:
+        f - function:
+            The function to time
+        value - unknown:
+            The argument of the function
+        repeat - int:
+            The number of measures, the best one is kept
+    Returns:
+        float:
+            The duration of one call, in nanoseconds
+    """
+    timer = timeit.Timer(lambda: f(value))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+def run(sizes=SIZES, repeat=5, names=None):
+    """Run the benchmarks.
+    Parameters:
+        sizes - tuple[int]:
+            The sizes of the containers
+        repeat - int:
+            The number of measures per case, the best one is kept
+        names - list[str] or None:
+            Only run the cases whose name starts with one of these, or all of
+            them if None
+    Returns:
+        dict:
+            The results, ready to be dumped as JSON
+    """
+    results = []
+    for name, typ, value, count in get_cases(sizes):
+        if names and not any(name.startswith(x) for x in names):
+            continue
+        baseline = _time(_identity, value, repeat)
+        # The decorated functions, with the kind of workers of the
+        # parallel checks (None for a sequential check)
+        checks = [("accepts", accepts(typ)(_identity), None),
+                  ("returns", returns(typ)(_identity), None)]
+        if typing.get_origin(typ) is list and \
+           typing.get_origin(typing.get_args(typ)[0]) is not None:
+            checks.append(("validate_batch", _batch(typ), None))
+        if typing.get_origin(typ) in (list, set, dict) and \
+           len(value) >= PARALLEL_THRESHOLD:
+            checks += [("accepts_" + x, accepts(typ)(_identity), x)
+                       for x in ("thread", "process")]
+        for decorator, decorated, kind in checks:
+            if kind is not None:
+                set_parallel(PARALLEL_THRESHOLD, kind=kind)
+            try:
+                overhead = _time(decorated, value, repeat) - baseline
+            finally:
+                set_parallel(None)
+            results.append({"name": name + "/" + decorator,
+                            "type": repr(typ),
+                            "elements": count,
+                            "baseline_ns": baseline,
+                            "overhead_ns": overhead,
+                            "overhead_ns_per_element": overhead / count})
+    return {"python": sys.version,
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results}
+
+def compare(old, new):
+    """Compare the results of two runs.
+    Parameters:
+        old - dict:
+            The results of the reference run
+        new - dict:
+            The results of the new run
+    Returns:
+        list[tuple]:
+            A list of (name, old overhead, new overhead, ratio) tuples for the
+            cases found in both runs, the ratio being new / old
+    """
+    old_results = {x["name"]: x for x in old["results"]}
+    rows = []
+    for result in new["results"]:
+        if result["name"] in old_results:
+            before = old_results[result["name"]]["overhead_ns"]
+            after = result["overhead_ns"]
+            rows.append((result["name"], before, after,
+                         after / before if before > 0 else float("inf")))
+    return rows
@@ -10,8 +10,11 @@ setuptools.setup(
     long_description="Uses decorators on functions and method to check the arguments types and return type at runtime. ",
     url="https://github.com/Karexar/typechecker",
 
-    packages=setuptools.find_packages(exclude=("tests",)),
+    packages=setuptools.find_packages(exclude=("tests", "benchmarks")),
     #scripts=["typecheck.py"],
+    entry_points={
+        "console_scripts": ["typecheck-file=typechecker.files:main"],
+    },
 
     classifiers=(
         "Programming Language :: Python :: 3.7",
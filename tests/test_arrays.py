@@ -0,0 +1,64 @@
+from typechecker.typecheck import *
+from typechecker.arrays import *
+from tests.test_typecheck import get_foo_params, get_error_regex
+import array
+import pytest
+
+
+def test_ndarray():
+    numpy = pytest.importorskip("numpy")
+    foo = get_foo_params(NDArray[numpy.float64])
+    assert(foo(numpy.zeros(10)))
+    assert(foo(numpy.zeros((2, 3))))
+    with pytest.raises(TypeError, match=get_error_regex("ndarray[float64]",
+                                                        "ndarray[int64]")):
+        foo(numpy.zeros(10, dtype=numpy.int64))
+    with pytest.raises(TypeError, match=get_error_regex("ndarray",
+                                                        "list")):
+        foo([1.5])
+
+def test_ndarray_shape():
+    numpy = pytest.importorskip("numpy")
+    foo = get_foo_params(NDArray[float, (None, 3)])
+    assert(foo(numpy.zeros((5, 3))))
+    error_regex = get_error_regex("ndarray[float64, (None, 3)]",
+                                  "ndarray[float64, (5, 2)]")
+    with pytest.raises(TypeError, match=error_regex):
+        foo(numpy.zeros((5, 2)))
+    with pytest.raises(TypeError):
+        foo(numpy.zeros(3))
+    foo = get_foo_params(List[NDArray[Any, (2,)]])
+    assert(foo([numpy.zeros(2), numpy.ones(2, dtype=int)]))
+    error_regex = get_error_regex("list[ndarray[any, (2,)]]",
+                                  "list[ndarray[float64, (3,)]]")
+    with pytest.raises(TypeError, match=error_regex):
+        foo([numpy.zeros(2), numpy.zeros(3)])
+
+def test_array():
+    foo = get_foo_params(Array["d"])
+    assert(foo(array.array("d", [1.5])))
+    with pytest.raises(TypeError, match=get_error_regex("array[d]",
+                                                        "array[i]")):
+        foo(array.array("i", [1]))
+    with pytest.raises(ValueError):
+        Array["x"]
+
+def test_buffer():
+    foo = get_foo_params(Buffer["B"])
+    assert(foo(b"abc"))
+    assert(foo(bytearray(3)))
+    assert(foo(memoryview(b"abc")))
+    with pytest.raises(TypeError, match=get_error_regex("buffer[B]",
+                                                        "buffer[d]")):
+        foo(array.array("d", [1.5]))
+    with pytest.raises(TypeError, match=get_error_regex("buffer", "list")):
+        foo([1])
+    foo = get_foo_params(Buffer["i", (None, 2)])
+    assert(foo(memoryview(array.array("i", range(6))).cast("B")
+                                                     .cast("i", (3, 2))))
+    with pytest.raises(TypeError):
+        foo(array.array("i", range(6)))
+
+def test_array_types_cached():
+    assert(compile_type(Array["d"]) is compile_type(Array["d"]))
+    assert(compile_type(Buffer["B"]) is not compile_type(Buffer["d"]))
@@ -0,0 +1,92 @@
+from typechecker.typecheck import *
+from typechecker.batch import *
+from tests.test_typecheck import get_foo_params, get_error_regex
+import collections
+import typing
+import pytest
+
+
+def get_batch_error(records, schema):
+    """Get the errors raised by validate_batch and by accepts for a batch.
+    Parameters:
+        records - list:
+            The records
+        schema - type or typing._GenericAlias:
+            The expected type of each record
+    Returns:
+        tuple:
+            The TypeError raised by validate_batch and the one raised by
+            accepts(List[schema])
+    """
+    with pytest.raises(TypeError) as batch_error:
+        validate_batch(records, schema)
+    with pytest.raises(TypeError) as accepts_error:
+        get_foo_params(List[schema])(records)
+    return batch_error.value, accepts_error.value
+
+def test_validate_batch_tuples():
+    Point = collections.namedtuple("Point", ["x", "y"])
+    validate_batch([(1, "a", 1.5), (2, "b", 2.5)], Tuple[int, str, float])
+    validate_batch([Point(1, 2), (3, 4)], Tuple[int, int])
+    validate_batch([(True, "a")], Tuple[int, Any])
+    validate_batch([], Tuple[int, str])
+    validate_batch(((x, str(x)) for x in range(3)), Tuple[int, str])
+    error_regex = get_error_regex("list[tuple[int, str]]",
+                                  "list[tuple[int, int]]")
+    with pytest.raises(TypeError, match=error_regex):
+        validate_batch([(1, "a"), (2, "b"), (3, 4)], Tuple[int, str])
+
+def test_validate_batch_first_error():
+    # The first wrong record is reported, whatever the wrong field
+    records = [(1, "a"), (2, "b"), (3, 4.5), ("c", 5), (6,)]
+    batch_error, accepts_error = get_batch_error(records, Tuple[int, str])
+    assert(batch_error.path == accepts_error.path == (2,))
+    assert(str(batch_error).replace("validate_batch", "bar") ==
+           str(accepts_error))
+    batch_error, accepts_error = get_batch_error([(1, "a"), (2,)],
+                                                 Tuple[int, str])
+    assert(batch_error.path == accepts_error.path == (1,))
+    batch_error, accepts_error = get_batch_error([(1, "a"), [2, "b"]],
+                                                 Tuple[int, str])
+    assert(batch_error.path == accepts_error.path == (1,))
+
+def test_validate_batch_nested():
+    schema = Tuple[int, List[str]]
+    validate_batch([(1, ["a"]), (2, [])], schema)
+    records = [(1, ["a"]), (2, ["b", 3])]
+    batch_error, accepts_error = get_batch_error(records, schema)
+    assert(batch_error.path == accepts_error.path == (1, 1, 1))
+    assert(str(batch_error).replace("validate_batch", "bar") ==
+           str(accepts_error))
+
+def test_validate_batch_dicts():
+    validate_batch([{"a": 1}, {"b": 2, "c": 3}], Dict[str, int])
+    validate_batch([collections.OrderedDict(a=1)],
+                   typing.Mapping[str, int])
+    records = [{"a": 1}, {"b": "x"}, {1: 2}]
+    batch_error, accepts_error = get_batch_error(records, Dict[str, int])
+    assert(batch_error.path == accepts_error.path == (1, "b"))
+    batch_error, accepts_error = get_batch_error([{"a": 1}, {2: 2}],
+                                                 Dict[str, int])
+    assert(batch_error.path == accepts_error.path == (1, 2))
+
+def test_validate_batch_other_schemas():
+    validate_batch([1, True, 2], int)
+    validate_batch([[1], [2, 3]], List[int])
+    validate_batch([1, "a"], Union[int, str])
+    with pytest.raises(TypeError):
+        validate_batch([1, 2.5], int)
+    batch_error, accepts_error = get_batch_error([[1], [2, "x"]], List[int])
+    assert(batch_error.path == accepts_error.path == (1, 1))
+
+def test_validate_batch_numpy():
+    numpy = pytest.importorskip("numpy")
+    table = numpy.zeros(3, dtype=[("x", numpy.int32), ("y", numpy.float64)])
+    validate_batch(table, Tuple[int, float])
+    validate_batch(numpy.zeros((3, 2)), Tuple[float, float])
+    with pytest.raises(TypeError):
+        validate_batch(table, Tuple[int, int])
+    with pytest.raises(TypeError):
+        validate_batch(numpy.zeros((3, 2)), Tuple[float, float, float])
+    with pytest.raises(NotImplementedError):
+        validate_batch(table, Tuple[int, List[int]])
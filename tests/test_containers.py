@@ -0,0 +1,88 @@
+from typechecker.typecheck import *
+from typechecker.containers import *
+from tests.test_typecheck import get_foo_params, get_error_regex
+import pickle
+import pytest
+
+
+def test_checked_list():
+    values = CheckedList[Tuple[str, int]]([("a", 1)])
+    values.append(("b", 2))
+    values += [("c", 3)]
+    values[0] = ("d", 4)
+    values[1:2] = [("e", 5)]
+    assert(values == [("d", 4), ("e", 5), ("c", 3)])
+    error_regex = get_error_regex("list[tuple[str, int]]",
+                                  "list[tuple[str, float]]")
+    with pytest.raises(TypeError, match=error_regex):
+        values.append(("f", 1.5))
+    with pytest.raises(TypeError):
+        values.insert(0, 1)
+    with pytest.raises(TypeError):
+        values.extend([("f", 1), 1])
+    with pytest.raises(TypeError):
+        values[0] = None
+    with pytest.raises(TypeError):
+        CheckedList[int]([1.5])
+    assert(len(values) == 3)
+    with pytest.raises(TypeError):
+        CheckedList([1])
+
+def test_checked_dict():
+    values = CheckedDict[str, List[int]](a=[1])
+    values["b"] = [2]
+    values.update({"c": [3]})
+    values |= {"d": [4]}
+    assert(values.setdefault("e", []) == [])
+    with pytest.raises(TypeError):
+        values["f"] = ["x"]
+    with pytest.raises(TypeError):
+        values.update({1: [1]})
+    with pytest.raises(TypeError):
+        values.setdefault("g")
+    assert(sorted(values) == ["a", "b", "c", "d", "e"])
+
+def test_checked_set():
+    values = CheckedSet[int]({1})
+    values.add(2)
+    values |= {3}
+    values ^= {4}
+    with pytest.raises(TypeError):
+        values.add("a")
+    with pytest.raises(TypeError):
+        values.update({5}, {"b"})
+    assert(values == {1, 2, 3, 4})
+
+def test_checked_pickle():
+    values = CheckedDict[str, int](a=1)
+    copy = pickle.loads(pickle.dumps(values))
+    assert(type(copy) is type(values))
+    assert(copy == values)
+
+def test_accepts_checked():
+    foo = get_foo_params(List[Tuple[str, int]])
+    values = CheckedList[Tuple[str, int]]([("a", 1)] * 1000)
+    assert(foo(values))
+    # The elements are not checked again (the list is only corrupted here
+    # to show it)
+    list.append(values, ("a", 1.5))
+    assert(foo(values))
+    # The container must have the expected element types
+    with pytest.raises(TypeError):
+        get_foo_params(List[Tuple[str, float]])(values)
+    foo = get_foo_params(Dict[str, Set[int]])
+    assert(foo({"a": CheckedSet[int]({1})}))
+    foo = get_foo_params(List[typing.Sequence[int]])
+    assert(foo([CheckedList[int]([1])]))
+
+def test_accepts_checked_mutable_elements():
+    # The nested lists can change after they were added : they are checked
+    # again
+    values = CheckedList[List[int]]([[1]])
+    values[0].append("x")
+    with pytest.raises(TypeError):
+        get_foo_params(List[List[int]])(values)
+    values = CheckedDict[str, List[int]]({"a": [1]})
+    values["a"].append("x")
+    with pytest.raises(TypeError):
+        get_foo_params(Dict[str, List[int]])(values)
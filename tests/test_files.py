@@ -0,0 +1,114 @@
+from typechecker.files import *
+import io
+import json
+import pytest
+import typing
+
+
+def write_jsonl(path, records):
+    """Write records in a JSON Lines file.
+    Parameters:
+        path - pathlib.Path:
+            The path of the file
+        records - list:
+            The records
+    Returns:
+        str:
+            The path of the file
+    """
+    path.write_text("".join(json.dumps(x) + "\n" for x in records))
+    return str(path)
+
+def test_validate_file_json(tmp_path):
+    records = [{"id": i, "name": "a"} for i in range(1000)]
+    records[10]["id"] = "b"
+    records[900]["name"] = None
+    path = write_jsonl(tmp_path / "records.jsonl", records)
+    output = io.StringIO()
+    assert(validate_file(path, "Dict[str, Union[int, str]]", workers=1,
+                         chunk_size=100, output=output) == (1000, 1))
+    assert(output.getvalue() == path + ":901: expected dict[str, union[int, "
+                                "str]], have dict[str, union[NoneType]] "
+                                "at ['name']\n")
+
+def test_validate_file_max_violations(tmp_path):
+    path = write_jsonl(tmp_path / "records.jsonl", [[i] for i in range(50)])
+    output = io.StringIO()
+    assert(validate_file(path, "List[str]", workers=1, chunk_size=64,
+                         max_violations=3, output=output) == (50, 50))
+    assert([x.split(":")[1] for x in output.getvalue().splitlines()] ==
+           ["1", "2", "3"])
+
+def test_validate_file_invalid_lines(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text('[1, 2]\n\n[3, 4\n[5, "6"]\n')
+    output = io.StringIO()
+    assert(validate_file(str(path), "Tuple[int, int]", workers=1,
+                         output=output) == (3, 2))
+    lines = output.getvalue().splitlines()
+    assert(lines[0].startswith(str(path) + ":3: invalid JSON"))
+    assert(lines[1] == str(path) + ":4: expected tuple[int, int], have "
+                                   "tuple[int, str]")
+
+def test_validate_file_csv(tmp_path):
+    path = tmp_path / "points.csv"
+    path.write_text("id,x,y\r\n1,1.5,2\r\n2,,3\r\n3,a,4\r\n")
+    output = io.StringIO()
+    assert(validate_file(str(path), "Tuple[int, Optional[float], float]",
+                         workers=1, output=output) == (3, 1))
+    assert(output.getvalue().startswith(str(path) + ":4: "))
+    output = io.StringIO()
+    assert(validate_file(str(path), "Dict[str, float]", workers=1,
+                         output=output) == (3, 2))
+    assert(output.getvalue().splitlines()[0].endswith("at ['x']"))
+
+def test_validate_file_workers(tmp_path):
+    records = [{"id": i} for i in range(5000)]
+    records[4321]["id"] = 1.5
+    path = write_jsonl(tmp_path / "records.jsonl", records)
+    output = io.StringIO()
+    assert(validate_file(path, "Dict[str, int]", workers=2, chunk_size=4096,
+                         output=output) == (5000, 1))
+    assert(output.getvalue().startswith(path + ":4322: "))
+
+def test_main(tmp_path, capsys):
+    path = write_jsonl(tmp_path / "records.jsonl", [1, 2])
+    assert(main([path, "int", "--workers", "1"]) == 0)
+    assert("2 records, 0 violations" in capsys.readouterr().err)
+    assert(main([path, "str", "--workers", "1"]) == 1)
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    assert(main([str(empty), "int"]) == 0)
+    with pytest.raises(SystemExit):
+        main([path, "Foo[int]"])
+    assert("unknown name Foo" in capsys.readouterr().err)
+
+@pytest.mark.parametrize("schema", ["__import__('os').getcwd()",
+                                    "object.__subclasses__()",
+                                    "int.__class__",
+                                    "List[lambda: 1]",
+                                    "Tuple[int, ...]",
+                                    "Dict[str, 1]"])
+def test_validate_file_invalid_schema(tmp_path, schema):
+    path = write_jsonl(tmp_path / "records.jsonl", [1])
+    with pytest.raises(ValueError, match=r"Invalid schema"):
+        validate_file(path, schema, workers=1)
+
+def test_validate_file_schema_names(tmp_path):
+    path = write_jsonl(tmp_path / "records.jsonl", [[1, None], [2, 1.5]])
+    output = io.StringIO()
+    assert(validate_file(path, "list[int | str | None]", workers=1,
+                         output=output) == (2, 1))
+
+class Point(typing.TypedDict):
+    id: int
+    x: float
+
+def test_validate_file_csv_typed_dict(tmp_path):
+    path = tmp_path / "points.csv"
+    path.write_text("id,x\n1,1.5\n2,a\n")
+    output = io.StringIO()
+    assert(validate_file(str(path), __name__ + ":Point", workers=1,
+                         output=output) == (2, 1))
+    assert(output.getvalue() == str(path) + ":3: expected Point[x: float], "
+                                            "have Point[x: str] at ['x']\n")
@@ -0,0 +1,177 @@
+from typechecker.instrument import *
+from typing import List
+import pytest
+import sys
+import textwrap
+import warnings
+
+SOURCE = '''
+from typing import List
+
+def foo(arg: List[int]) -> int:
+    return len(arg)
+
+def untyped(arg):
+    return arg
+
+class Bar:
+    def foo(self, arg: int) -> str:
+        return str(arg)
+
+    @staticmethod
+    def bar(arg: int):
+        return arg
+
+    @property
+    def baz(self) -> int:
+        return "a"
+'''
+
+@pytest.fixture
+def package(tmp_path):
+    """Write a package 'instrumented' made of two modules with the same code,
+    and remove it from the imported modules afterwards.
+    """
+    root = tmp_path / "instrumented"
+    root.mkdir()
+    (root / "__init__.py").write_text(SOURCE)
+    (root / "sub.py").write_text(SOURCE)
+    sys.path.insert(0, str(tmp_path))
+    yield "instrumented"
+    sys.path.remove(str(tmp_path))
+    for name in ("instrumented", "instrumented.sub"):
+        sys.modules.pop(name, None)
+
+def assert_checked(module):
+    assert(module.foo([1]) == 1)
+    with pytest.raises(TypeError, match=r"parameter 0 of method 'foo'"):
+        module.foo([1.5])
+    assert(module.untyped(1.5) == 1.5)
+    assert(module.Bar().foo(1) == "1")
+    with pytest.raises(TypeError):
+        module.Bar().foo("1")
+    with pytest.raises(TypeError):
+        module.Bar.bar(1.5)
+    with pytest.raises(TypeError, match=r"return value of method 'baz'"):
+        module.Bar().baz
+
+def test_typecheck_class():
+    @typecheck_class
+    class Foo:
+        def foo(self, arg: int):
+            return arg
+
+        class Bar:
+            @classmethod
+            def bar(cls, arg: List[int]):
+                return arg
+    assert(Foo().foo(1) == 1)
+    with pytest.raises(TypeError):
+        Foo().foo(1.5)
+    with pytest.raises(TypeError):
+        Foo.Bar.bar([1.5])
+    # Instrumenting twice does not add a second check
+    foo = Foo.foo
+    typecheck_class(Foo)
+    assert(Foo.foo is foo)
+
+def test_typecheck_package(package):
+    modules = typecheck_package(package)
+    assert([x.__name__ for x in modules] == ["instrumented",
+                                             "instrumented.sub"])
+    for module in modules:
+        assert_checked(module)
+
+def test_import_hook(package):
+    hook = install_import_hook(package)
+    try:
+        import instrumented.sub
+    finally:
+        uninstall_import_hook(hook)
+    assert(hook not in sys.meta_path)
+    assert_checked(sys.modules["instrumented"])
+    assert_checked(sys.modules["instrumented.sub"])
+
+def test_typecheck_module_postponed_annotations(tmp_path):
+    (tmp_path / "postponed.py").write_text(textwrap.dedent('''
+        from __future__ import annotations
+        import dataclasses
+        from typing import List, NamedTuple
+
+        class Point(NamedTuple):
+            x: int
+
+        @dataclasses.dataclass
+        class Record:
+            values: List[int]
+
+        def foo(arg: Point) -> int:
+            return arg.x
+    '''))
+    sys.path.insert(0, str(tmp_path))
+    try:
+        module = typecheck_module("postponed")
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("postponed", None)
+    assert(module.Point(1) == (1,))
+    assert(module.foo(module.Point(1)) == 1)
+    with pytest.raises(TypeError):
+        module.foo(module.Point("a"))
+    assert(module.Record([1]).values == [1])
+    with pytest.raises(TypeError):
+        module.Record(["a"])
+
+def test_typecheck_module_unsupported_annotations(tmp_path):
+    (tmp_path / "unsupported.py").write_text(textwrap.dedent('''
+        from __future__ import annotations
+        from typing import (TYPE_CHECKING, Callable, Literal, Protocol,
+                            Tuple, Type, TypeVar)
+        if TYPE_CHECKING:
+            from decimal import Decimal
+
+        T = TypeVar("T")
+
+        class Named(Protocol):
+            name: str
+
+        def hidden(arg: Decimal, other: int) -> Decimal:
+            return arg
+
+        def callback(arg: Callable[[int], int], other: int) -> int:
+            return arg(other)
+
+        def literal(arg: Literal["a", "b"], other: int):
+            return arg
+
+        def cls(arg: Type[int], other: int):
+            return arg
+
+        def variadic(arg: Tuple[int, ...], other: int):
+            return arg
+
+        def generic(arg: T, other: int) -> T:
+            return arg
+
+        def protocol(arg: Named, other: int):
+            return arg
+    '''))
+    sys.path.insert(0, str(tmp_path))
+    try:
+        module = typecheck_module("unsupported")
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("unsupported", None)
+    calls = [(module.hidden, 1.5), (module.callback, abs),
+             (module.literal, "c"), (module.cls, str),
+             (module.variadic, (1, "a")), (module.generic, 1.5),
+             (module.protocol, 1)]
+    for function, arg in calls:
+        with pytest.warns(RuntimeWarning, match=r"not checked for 'arg'"):
+            assert(function(arg, 1) in (arg, 1))
+        # The warning is emitted once, and the other annotations are checked
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            function(arg, 1)
+        with pytest.raises(TypeError, match=r"parameter 1 of"):
+            function(arg, "1")
@@ -1,6 +1,9 @@
-from typecheck import *
+from typechecker.typecheck import *
 import pytest
+import typing
 import re
+import collections
+import dataclasses
 
 
 def get_foo_params(*types, **kwargs_types):
@@ -99,6 +102,98 @@ def test_kwargs():
     with pytest.raises(TypeError, match=regex):
         foo(1, x=1, y=1.5)
 
+def test_kwargs_passed():
+    @accepts(int, x=int)
+    def foo(arg, x=0):
+        return arg + x
+    assert(foo(1, x=2) == 3)
+    assert(foo(1, 2) == 3)
+    assert(foo(1) == 1)
+    # A parameter typed by position can be given by name
+    assert(foo(arg=1) == 1)
+    with pytest.raises(TypeError, match=r"Have :      float"):
+        foo(arg=1.5)
+    with pytest.raises(ValueError, match="Mismatch count"):
+        foo()
+
+def test_accepts_method():
+    class Foo:
+        # self does not need a type, but can still be given one
+        @accepts(int)
+        def foo(self, arg):
+            return arg
+
+        @accepts(Any, int)
+        def bar(self, arg):
+            return arg
+
+        @classmethod
+        @accepts(int)
+        def baz(cls, arg):
+            return arg
+    for method in (Foo().foo, Foo().bar, Foo.baz):
+        assert(method(1) == 1)
+        with pytest.raises(TypeError, match=r"Expected :  int"):
+            method(1.5)
+
+def test_accepts_var_args():
+    @accepts(int, args=str, kwargs=float)
+    def foo(arg, *args, **kwargs):
+        return len(args) + len(kwargs)
+    assert(foo(1) == 0)
+    assert(foo(1, "a", "b", x=1.5) == 3)
+    with pytest.raises(TypeError, match=r"parameter 2 "):
+        foo(1, "a", 2)
+    with pytest.raises(TypeError, match=r"parameter 'y' "):
+        foo(1, x=1.5, y=1)
+
+# The forward reference is only resolved on the first call
+@typechecked
+def typechecked_foo(arg: "List[Bar]", other, *args: int,
+                    sample: int = 0) -> "Bar":
+    return arg[0]
+
+class Bar:
+    pass
+
+def test_typechecked(monkeypatch):
+    resolved = []
+    get_type_hints = typing.get_type_hints
+    monkeypatch.setattr(typing, "get_type_hints",
+                        lambda f: resolved.append(f) or get_type_hints(f))
+    foo = typechecked_foo
+    assert(isinstance(foo([Bar()], "a", 1, 2, sample=1), Bar))
+    foo([Bar()], 1.5)
+    with pytest.raises(TypeError, match=get_error_regex("list[Bar]",
+                                                        "list[int]")):
+        foo([1], None)
+    with pytest.raises(TypeError, match=r"parameter 3 "):
+        foo([Bar()], None, 1, 1.5)
+    with pytest.raises(TypeError, match=r"parameter 'sample' "):
+        foo([Bar()], None, sample=None)
+    assert(len(resolved) == 1)
+
+def test_typechecked_method():
+    class Foo:
+        @typechecked(sample=10)
+        def foo(self, arg: List[int]) -> None:
+            return arg[0] if arg else None
+    assert(Foo().foo([]) is None)
+    with pytest.raises(TypeError, match=r"parameter 0 "):
+        Foo().foo([1.5])
+    with pytest.raises(TypeError, match=r"return value"):
+        Foo().foo([1])
+
+@pytest.mark.parametrize("types, kwargs_types",
+    [((int, int), {}),
+     ((int,), {"arg": int}),
+     ((int,), {"other": int})])
+def test_accepts_wrong_binding(types, kwargs_types):
+    def foo(arg):
+        return arg
+    with pytest.raises(ValueError):
+        accepts(*types, **kwargs_types)(foo)
+
 # Note that the parameters are given as a tuple
 @pytest.mark.parametrize("types, expected, actual, args",
     [((int,),               r"int",         r"float",       (1.1,)),
@@ -186,3 +281,809 @@ def test_returns_wrong(types, expected, actual, values):
         print("actual type      : " + str(actual))
         print("return value     : " + str(values))
         raise(e)
+
+def test_compile_type_cached():
+    typ = Tuple[Dict[str, List[int]], Set[float]]
+    assert(compile_type(typ) is compile_type(typ))
+    # Unions are equal whatever the order, but the message depends on it
+    assert(compile_type(Union[int, str]) is not compile_type(Union[str, int]))
+
+def test_compile_type_unsupported():
+    with pytest.raises(NotImplementedError):
+        compile_type(typing.Callable[[int], int])
+
+def test_accepts_dict_union_values():
+    foo = get_foo_params(Dict[str, Union[int, str]])
+    assert(foo({"a": 1, "b": "c"}))
+    error_regex = get_error_regex("dict[str, union[int, str]]",
+                                  "dict[str, union[float]]")
+    with pytest.raises(TypeError, match=error_regex):
+        foo({"a": 1, "b": 1.5})
+
+@pytest.mark.parametrize("typ, name",
+    [(int,                      "int"),
+     (Any,                      "any"),
+     (None,                     "NoneType"),
+     (List[int],                "list"),
+     (list[int],                "list"),
+     (Dict[str, int],           "dict"),
+     (Union[int, str],          "union"),
+     (typing.Optional[int],     "union"),
+     (typing.Callable[[], int], "callable")])
+def test_get_name(typ, name):
+    assert(get_name(typ) == name)
+
+@pytest.mark.parametrize("types, args",
+    [((typing.Optional[int],),      (None,)),
+     ((typing.Optional[int],),      (1,)),
+     ((list[int],),                 ([1, 2],)),
+     ((dict[str, List[int]],),      ({"a": [1]},)),
+     ((List,),                      ([1, "a"],))])
+def test_accepts_structural_types(types, args):
+    foo = get_foo_params(*types)
+    assert(foo(*args))
+
+@pytest.mark.parametrize("types, expected, actual, args",
+    [((List[Tuple[str, int]],),
+        r"list[tuple[str, int]]",   r"list[tuple[str, float]]",
+            ([("a", 1), ("b", 1.5)],)),
+     ((List[Tuple[str, int]],),
+        r"list[tuple[str, int]]",   r"list[tuple[str]]",
+            ([("a", 1), ("b",)],)),
+     ((List[Tuple[str, int]],),
+        r"list[tuple]",             r"list[list]",
+            ([("a", 1), ["b", 1]],)),
+     ((List[Union[int, str]],),
+        r"list[union[int, str]]",   r"list[union[float]]",
+            ([1, "a", 1.5],)),
+     ((Dict[str, float],),
+        r"dict[str, float]",        r"dict[int, float]",
+            ({"a": 1.5, 1: 1.5},))])
+def test_accepts_wrong_fast_paths(types, expected, actual, args):
+    foo = get_foo_params(*types)
+    with pytest.raises(TypeError, match=get_error_regex(expected, actual)):
+        foo(*args)
+
+@pytest.mark.parametrize("types, kwargs, args, path",
+    [((Dict[str, List[int]],), {}, ({"a": [1], "b": [1, "x"]},), ("b", 1)),
+     ((List[Tuple[int, List[str]]],), {}, ([(1, ["a"]), (1, ["a", 2])],),
+        (1, 1, 1)),
+     ((Set[int],), {}, ({1, "x"},), ("x",)),
+     ((List[int],), {"sample": 2}, ([1] * 5 + ["x"] + [1] * 4,), (5,)),
+     ((Set[int],), {"sample": 2}, ({1.5, 2, 3},), (1.5,)),
+     ((typing.FrozenSet[int],), {"sample": 2}, (frozenset({1, 2.5, 3}),),
+        (2.5,))])
+def test_error_path(types, kwargs, args, path):
+    foo = get_foo_params(*types, **kwargs)
+    with pytest.raises(TypeError) as info:
+        foo(*args)
+    assert(info.value.path == path)
+
+def test_accepts_sample():
+    foo = get_foo_params(List[int], sample=10)
+    # Only the elements at regular intervals are checked
+    assert(foo(list(range(99)) + [1.5]))
+    values = list(range(100))
+    values[50] = 1.5
+    with pytest.raises(TypeError, match=get_error_regex("list[int]",
+                                                        "list[float]")):
+        foo(values)
+    foo = get_foo_params(Dict[int, Set[int]], sample=2)
+    assert(foo({1: {1, 2, 3}, 2: {4}}))
+    with pytest.raises(TypeError):
+        foo({1: {1.5, 2.5}})
+    # The first elements of the dicts and sets are checked, without walking
+    # the rest of them
+    foo = get_foo_params(Dict[int, int], sample=10)
+    values = dict.fromkeys(range(100), 1)
+    values[100] = 1.5
+    assert(foo(values))
+    values[5] = 1.5
+    with pytest.raises(TypeError):
+        foo(values)
+
+def test_sample_size_global():
+    foo = get_foo_params(List[int])
+    values = list(range(99)) + [1.5]
+    set_sample_size(10)
+    try:
+        assert(get_sample_size() == 10)
+        assert(foo(values))
+    finally:
+        set_sample_size(None)
+    with pytest.raises(TypeError):
+        foo(values)
+
+@pytest.mark.parametrize("sample", [0, -1, 1.5])
+def test_sample_size_invalid(sample):
+    with pytest.raises(ValueError):
+        set_sample_size(sample)
+    with pytest.raises(ValueError):
+        returns(int, sample=sample)
+
+def test_cache():
+    from typechecker import typecheck
+    foo = get_foo_params(Tuple[int, Tuple[str, float]])
+    values = [(i, ("a", 1.5)) for i in range(3)]
+    set_cache_size(2)
+    try:
+        assert(get_cache_size() == 2)
+        foo(values[0])
+        foo(values[0])
+        assert(len(typecheck._cache) == 1)
+        foo(values[1])
+        foo(values[2])
+        # The least recently checked value is evicted
+        assert(len(typecheck._cache) == 2)
+        with pytest.raises(TypeError):
+            foo((1, ("a", 1)))
+        assert(len(typecheck._cache) == 2)
+    finally:
+        set_cache_size(None)
+    assert(typecheck._cache is None)
+
+def test_cache_mutable_types():
+    from typechecker import typecheck
+    set_cache_size(10)
+    try:
+        get_foo_params(Tuple[int, List[int]])((1, [1]))
+        get_foo_params(List[int])([1])
+        assert(len(typecheck._cache) == 0)
+        value = frozenset({1, 2})
+        get_foo_params(typing.FrozenSet[int])(value)
+        assert(len(typecheck._cache) == 1)
+        # frozensets are weakly referenced, they leave the cache when deleted
+        del value
+        assert(len(typecheck._cache) == 0)
+    finally:
+        set_cache_size(None)
+
+def test_accepts_frozenset():
+    foo = get_foo_params(typing.FrozenSet[int])
+    assert(foo(frozenset({1, 2})))
+    with pytest.raises(TypeError, match=get_error_regex("frozenset[int]",
+                                                        "frozenset[str]")):
+        foo(frozenset({"a"}))
+
+def test_accepts_iterator():
+    @accepts(typing.Iterator[int])
+    def total(values):
+        return sum(values)
+    assert(total(iter([1, 2, 3])) == 6)
+    regex = r"Type error on element 2 of parameter 0 of method 'total' :\n" \
+            + r"\s+Expected :\s+iterator\[int\]\n\s+Have :\s+iterator\[str\]$"
+    with pytest.raises(TypeError, match=regex):
+        total(iter([1, 2, "a"]))
+    with pytest.raises(TypeError, match=get_error_regex("iterator", "list")):
+        total([1, 2, 3])
+
+def test_accepts_iterable():
+    @accepts(typing.Iterable[Tuple[str, int]])
+    def keys(values):
+        return [x[0] for x in values] + [x[0] for x in values]
+    values = [("a", 1), ("b", 2)]
+    assert(keys(values) == ["a", "b", "a", "b"])
+    with pytest.raises(TypeError,
+                       match=get_error_regex("iterable[tuple[str, int]]",
+                                             "iterable[tuple[str, float]]")):
+        keys([("a", 1), ("b", 1.5)])
+
+def test_returns_generator():
+    @returns(typing.Generator[int, None, str])
+    def gen(values, result):
+        for x in values:
+            yield x
+        return result
+    assert(list(gen([1, 2], "done")) == [1, 2])
+    consumed = []
+    with pytest.raises(TypeError, match=r"element 1 of return value"):
+        for x in gen([1, 1.5, 2], "done"):
+            consumed.append(x)
+    assert(consumed == [1])
+    error_regex = get_error_regex("generator[int, NoneType, str]",
+                                  "generator[int, NoneType, int]")
+    with pytest.raises(TypeError, match=error_regex):
+        list(gen([1], 1))
+
+def test_nested_iterator():
+    foo = get_foo_params(List[typing.Iterator[int]])
+    assert(foo([iter([1.5])]))
+    with pytest.raises(TypeError, match=get_error_regex("list[iterator]",
+                                                        "list[list]")):
+        foo([[1]])
+
+@pytest.fixture
+def restore_check_levels():
+    from typechecker import typecheck
+    levels = dict(typecheck._module_levels)
+    yield
+    typecheck._module_levels.clear()
+    typecheck._module_levels.update(levels)
+    typecheck._level_generation += 1
+
+def test_check_level_off(restore_check_levels):
+    def bar(arg):
+        return arg
+    set_check_level("off", __name__)
+    assert(get_check_level(__name__) == "off")
+    assert(get_check_level(__name__ + ".sub") == "off")
+    # The function is returned untouched
+    assert(accepts(int)(bar) is bar)
+    assert(returns(int)(bar) is bar)
+
+def test_check_level_runtime(restore_check_levels):
+    foo = get_foo_params(List[int])
+    bar = get_foo_return(List[int])
+    set_check_level("shallow", __name__)
+    assert(get_check_level() == "full")
+    assert(foo([1.5]))
+    assert(bar([1.5]) == [1.5])
+    with pytest.raises(TypeError, match=get_error_regex("list", "tuple")):
+        foo((1,))
+    set_check_level("off")
+    assert(foo([1.5]))
+    set_check_level("off", __name__)
+    assert(foo((1.5,)))
+    set_check_level("full", __name__)
+    with pytest.raises(TypeError):
+        foo([1.5])
+
+def test_check_level_setting(restore_check_levels):
+    from typechecker import typecheck
+    typecheck._load_check_levels("shallow, tests.foo=off,tests.foo.bar=full")
+    assert(get_check_level() == "shallow")
+    assert(get_check_level("tests.foo.baz") == "off")
+    assert(get_check_level("tests.foo.bar.baz") == "full")
+    assert(get_check_level("tests.foobar") == "shallow")
+    with pytest.raises(ValueError):
+        set_check_level("partial")
+
+@pytest.fixture
+def stats():
+    set_stats_enabled(True)
+    yield
+    set_stats_enabled(False)
+
+def test_stats(stats, tmp_path):
+    import json
+    @accepts(List[int], x=int)
+    @returns(int)
+    def total(values, x=0):
+        return sum(values) + x
+    name = __name__ + "." + total.__qualname__
+    assert(get_stats(name)["calls"] == 0)
+    total([1, 2, 3])
+    total([1], x=1)
+    with pytest.raises(TypeError):
+        total([1.5])
+    result = get_stats(name)
+    assert(result["calls"] == 3)
+    assert(result["elements"] == 3 + 1 + 1 + 1 + 1 + 1)
+    assert(result["violations"] == 1)
+    assert(0 < result["max_check_ns"] <= result["check_ns"])
+    dump_stats(tmp_path / "stats.json")
+    with open(tmp_path / "stats.json") as f:
+        assert(json.load(f)[name] == result)
+    reset_stats()
+    assert(get_stats() == {})
+
+def test_stats_disabled():
+    foo = get_foo_params(int)
+    foo(1)
+    assert(get_stats() == {})
+    assert(dump_stats() == "{}")
+
+@pytest.fixture
+def violations():
+    buffer = ViolationBuffer(10)
+    set_violation_sink(buffer)
+    yield buffer
+    set_violation_sink(None)
+
+def test_violation_sink(violations):
+    calls = []
+    @accepts(int, List[int])
+    def foo(x, values):
+        calls.append(x)
+        return x
+    assert(foo(1.5, ["a"]) == 1.5)
+    assert(foo(2.5, ["a"]) == 2.5)
+    # Only the first violation of a call is reported, once
+    assert(len(violations.violations) == 1)
+    msg, count = violations.violations[0]
+    assert(re.search(get_error_regex("int", "float"), msg))
+    assert(count == 1)
+    foo(1, ["a"])
+    assert(len(violations.violations) == 2)
+    assert(calls == [1.5, 2.5, 1])
+
+def test_violation_sink_interval(violations):
+    foo = get_foo_return(int)
+    set_violation_sink(violations, interval=0)
+    assert(foo(1.5) == 1.5)
+    assert(foo(1.5) == 1.5)
+    assert([x[1] for x in violations.violations] == [1, 1])
+    iterator = get_foo_return(typing.Iterator[int])(iter([1, "a", "b"]))
+    assert(list(iterator) == [1, "a", "b"])
+    assert(len(violations.violations) == 3)
+
+def test_violation_sink_same_name(violations):
+    class A:
+        @accepts(object, int)
+        def __init__(self, x):
+            pass
+
+    class B:
+        @accepts(object, int)
+        def __init__(self, x):
+            pass
+
+        @returns(typing.Iterator[int])
+        def values(self):
+            return iter(["a"])
+    for i in range(2):
+        A("a")
+        B("a")
+    # The messages are the same, but not the functions
+    assert([x[1] for x in violations.violations] == [1, 1])
+    list(B(1).values())
+    list(B(1).values())
+    assert(len(violations.violations) == 3)
+
+def test_violation_sink_logger(caplog):
+    import logging
+    set_violation_sink(logging.getLogger("typecheck"), interval=3600)
+    try:
+        foo = get_foo_params(int)
+        for i in range(3):
+            foo("a")
+    finally:
+        set_violation_sink(None)
+    assert(len(caplog.records) == 1)
+    assert(caplog.records[0].levelno == logging.WARNING)
+    with pytest.raises(TypeError):
+        foo("a")
+
+def test_violation_sink_threads(monkeypatch):
+    import threading
+    from typechecker import typecheck
+    # Violations forgotten and reported again all the time
+    monkeypatch.setattr(typecheck._Reporter, "max_violations", 2)
+    counts = []
+    set_violation_sink(lambda error, count: counts.append(count),
+                       interval=0)
+    try:
+        foo = get_foo_params(int)
+        values = [1.5, "a", b"a"] * 500
+        threads = [threading.Thread(target=lambda: [foo(x) for x in values])
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        set_violation_sink(None)
+    assert(sum(counts) == 8 * len(values))
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_parallel(kind):
+    foo = get_foo_params(List[Tuple[str, float]])
+    bar = get_foo_params(Dict[str, List[int]])
+    values = [("a", 1.5)] * 1000
+    set_parallel(100, workers=2, kind=kind)
+    try:
+        assert(get_parallel() == (100, 2, kind))
+        assert(foo(values))
+        assert(bar({str(i): [i] for i in range(1000)}))
+        values = values[:700] + [("a", 1)] + values[700:]
+        with pytest.raises(TypeError) as info:
+            foo(values)
+        # Same error as the sequential check
+        assert(info.value.path == (700,))
+        assert(re.search(get_error_regex("list[tuple[str, float]]",
+                                         "list[tuple[str, int]]"),
+                         str(info.value)))
+        with pytest.raises(TypeError) as info:
+            bar({str(i): [i] if i != 500 else ["a"] for i in range(1000)})
+        assert(info.value.path == ("500", 0))
+        # Small containers are checked sequentially
+        assert(foo([("a", 1.5)]))
+    finally:
+        set_parallel(None)
+    assert(get_parallel() is None)
+
+def test_parallel_auto(monkeypatch):
+    import sys
+    # Processes are never picked without being asked for
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: True, raising=False)
+    set_parallel(100)
+    assert(get_parallel() is None)
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False, raising=False)
+    set_parallel(100, workers=2)
+    try:
+        assert(get_parallel() == (100, 2, "thread"))
+    finally:
+        set_parallel(None)
+
+def test_async_function():
+    import asyncio
+    import inspect
+    @accepts(int)
+    @returns(List[int])
+    async def foo(x):
+        await asyncio.sleep(0)
+        return [x] if x > 0 else [1.5]
+    assert(inspect.iscoroutinefunction(foo))
+    assert(asyncio.run(foo(1)) == [1])
+    with pytest.raises(TypeError, match=get_error_regex("list[int]",
+                                                        "list[float]")):
+        asyncio.run(foo(-1))
+    with pytest.raises(TypeError, match=r"parameter 0 of method 'foo'"):
+        asyncio.run(foo(1.5))
+
+    @typechecked
+    async def bar(x: int) -> str:
+        return str(x)
+    assert(inspect.iscoroutinefunction(bar))
+    assert(asyncio.run(bar(1)) == "1")
+    with pytest.raises(TypeError):
+        asyncio.run(bar("1"))
+
+def test_async_generator():
+    import asyncio
+    import inspect
+    @accepts(List[Any])
+    @returns(typing.AsyncGenerator[int, int])
+    async def gen(values):
+        for x in values:
+            sent = yield x
+            if sent is not None:
+                yield sent
+
+    async def consume(values, send=None):
+        result = []
+        generator = gen(values)
+        async for x in generator:
+            result.append(x)
+            if send is not None and len(result) == 1:
+                result.append(await generator.asend(send))
+        return result
+    assert(inspect.isasyncgenfunction(gen))
+    assert(asyncio.run(consume([1, 2])) == [1, 2])
+    assert(asyncio.run(consume([1, 2], send=5)) == [1, 5, 2])
+    with pytest.raises(TypeError, match=r"element 1 of return value"):
+        asyncio.run(consume([1, "a"]))
+    with pytest.raises(TypeError, match=r"parameter 0 of method 'gen'"):
+        asyncio.run(consume((1, 2)))
+
+@pytest.mark.parametrize("typ", [typing.AsyncIterator[int],
+                                 typing.AsyncIterable[int]])
+def test_returns_async_generator_iterator(typ):
+    import asyncio
+    @returns(typ)
+    async def gen(values):
+        for x in values:
+            yield x
+
+    async def consume(values):
+        return [x async for x in gen(values)]
+    assert(asyncio.run(consume([1, 2, 3])) == [1, 2, 3])
+    with pytest.raises(TypeError, match=r"element 1 of return value"):
+        asyncio.run(consume([1, "x"]))
+
+def test_accepts_async_iterator():
+    import asyncio
+    async def values(*args):
+        for x in args:
+            yield x
+
+    @accepts(typing.AsyncIterator[int])
+    async def total(values):
+        return sum([x async for x in values])
+    assert(asyncio.run(total(values(1, 2))) == 3)
+    with pytest.raises(TypeError, match=r"element 1 of parameter 0"):
+        asyncio.run(total(values(1, 2.5)))
+
+@pytest.mark.parametrize("types, args, path",
+    [((List[List[int]],),       ([[1, "a"], "b"],),     (0, 1)),
+     ((Dict[str, List[int]],),  ({"a": ["x"], 1: [1]},), ("a", 0)),
+     ((Set[Tuple[int, List[int]]],), ({(1, (1,))},),    ((1, (1,)),))])
+def test_error_first_element(types, args, path):
+    # The check is depth-first, the first wrong element is reported even if
+    # a later element is wrong at a shallower level
+    foo = get_foo_params(*types)
+    with pytest.raises(TypeError) as info:
+        foo(*args)
+    assert(info.value.path == path)
+
+class Integer(int):
+    pass
+
+@pytest.mark.parametrize("types, args",
+    [((int,),                               (True,)),
+     ((List[int],),                         ([1, True, Integer(2)],)),
+     ((Tuple[int, str],),                   ((Integer(1), "a"),)),
+     ((Dict[str, int],),                    ({"a": True},)),
+     ((Dict[str, Union[int, str]],),        ({"a": True},)),
+     ((Set[Union[int, str]],),              ({Integer(1)},)),
+     ((List[Tuple[int, str]],),             ([(True, "a")],)),
+     ((typing.Sequence[int],),              ([1, 2],)),
+     ((typing.Sequence[int],),              ((1, True),)),
+     ((typing.MutableSequence[int],),       (collections.deque([1]),)),
+     ((typing.Mapping[str, List[int]],),    ({"a": [1]},)),
+     ((typing.Mapping[str, int],),          (collections.OrderedDict(a=1),)),
+     ((typing.AbstractSet[int],),           (frozenset({1}),)),
+     ((typing.Collection[str],),            (["a"],)),
+     ((collections.abc.Sequence,),          ((1, "a"),))])
+def test_accepts_subtypes(types, args):
+    foo = get_foo_params(*types)
+    assert(foo(*args))
+
+@pytest.mark.parametrize("types, expected, actual, args",
+    [((typing.Sequence[int],),
+        r"sequence[int]",           r"sequence[str]",       ([1, "a"],)),
+     ((typing.Sequence[int],),      r"Sequence",            r"set",
+            ({1},)),
+     ((typing.Mapping[str, int],),
+        r"mapping[str, int]",       r"mapping[str, float]", ({"a": 1.5},)),
+     ((List[bool],),
+        r"list[bool]",              r"list[int]",           ([True, 1],))])
+def test_accepts_wrong_subtypes(types, expected, actual, args):
+    foo = get_foo_params(*types)
+    with pytest.raises(TypeError, match=get_error_regex(expected, actual)):
+        foo(*args)
+
+def test_subtype_decisions_cached():
+    from typechecker import typecheck
+    foo = get_foo_params(List[int])
+    typecheck._subtypes.clear()
+    assert(foo([True] * 1000))
+    assert(list(typecheck._subtypes) == [(bool, int)])
+
+def test_schema_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "types.cache")
+    def foo(arg: "List[int]") -> int:
+        return len(arg)
+    set_schema_cache(path)
+    try:
+        assert(typechecked(foo)([1]) == 1)
+        save_schema_cache()
+        # The annotations are loaded from the file by the next runs
+        set_schema_cache(path)
+        def fail(f):
+            raise AssertionError("annotations resolved again")
+        monkeypatch.setattr(typing, "get_type_hints", fail)
+        checked = typechecked(foo)
+        assert(checked([1]) == 1)
+        with pytest.raises(TypeError):
+            checked([1.5])
+        # The entry is ignored once the annotations change
+        foo.__annotations__["arg"] = "List[str]"
+        with pytest.raises(AssertionError):
+            typechecked(foo)(["a"])
+    finally:
+        set_schema_cache(None)
+
+def test_schema_cache_imported_alias(tmp_path):
+    path = str(tmp_path / "types.cache")
+    def define(payload):
+        # A function whose annotation is an alias imported from another
+        # module, as seen by two runs of the program
+        namespace = {"__name__": "payloads", "Payload": payload}
+        exec("def foo(arg: 'Payload'):\n    return arg", namespace)
+        return namespace["foo"]
+    set_schema_cache(path)
+    try:
+        checked = typechecked(define(Dict[str, int]))
+        assert(checked({"a": 1}) == {"a": 1})
+        save_schema_cache()
+        # The entry is ignored once the alias changes
+        set_schema_cache(path)
+        checked = typechecked(define(Dict[str, str]))
+        assert(checked({"a": "s"}) == {"a": "s"})
+        with pytest.raises(TypeError):
+            checked({"a": 1})
+    finally:
+        set_schema_cache(None)
+
+@pytest.mark.parametrize("types, args",
+    [((List[Union[int, List[str]]],),           ([1, ["a"]],)),
+     ((Union[List[int], List[str]],),           (["a"],)),
+     ((Union[Tuple[int, str], Dict[str, int]],), ({"a": 1},)),
+     ((Union[int, typing.Iterator[int]],),      (iter([1]),)),
+     ((Union[None, Integer],),                  (Integer(1),)),
+     ((Union[str, int],),                       (True,))])
+def test_accepts_union_branches(types, args):
+    foo = get_foo_params(*types)
+    assert(foo(*args))
+
+@pytest.mark.parametrize("types, expected, actual, args",
+    [((List[Union[int, List[str]]],),
+        r"list[union[int, list[str]]]", r"list[union[int, list[int]]]",
+            ([1, [1]],)),
+     ((Union[Tuple[int, str], Dict[str, int]],),
+        r"union[tuple[...], dict[str, int]]",
+            r"union[tuple[...], dict[str, float]]",
+            ({"a": 1.5},)),
+     ((Union[List[int], List[str]],),
+        r"union[list[int], list[...]]", r"union[list[float], list[...]]",
+            ([1.5],))])
+def test_accepts_wrong_union_branches(types, expected, actual, args):
+    foo = get_foo_params(*types)
+    with pytest.raises(TypeError, match=get_error_regex(expected, actual)):
+        foo(*args)
+
+def test_union_many_members():
+    classes = [type("Record" + str(i), (), {}) for i in range(30)]
+    foo = get_foo_params(List[Union[tuple(classes)]])
+    assert(foo([cls() for cls in classes] * 10))
+    with pytest.raises(TypeError):
+        foo([classes[0](), 1])
+
+def test_error_surrounding():
+    foo = get_foo_params(Tuple[List[int], str])
+    error_regex = get_error_regex("tuple[list[int], str]",
+                                  "tuple[list[float], str]")
+    with pytest.raises(TypeError, match=error_regex):
+        foo(([1.5], "a"))
+
+class Point(typing.NamedTuple):
+    x: int
+    y: str
+
+@dataclasses.dataclass
+class Record:
+    key: int
+    points: List[Point]
+
+@dataclasses.dataclass(slots=True)
+class Node:
+    value: int
+    next: typing.Optional["Node"] = None
+
+class Movie(typing.TypedDict, total=False):
+    title: str
+    year: int
+
+class Rating(typing.TypedDict):
+    stars: int
+
+@pytest.mark.parametrize("types, args",
+    [((Point,),                         (Point(1, "a"),)),
+     ((List[Point],),                   ([Point(1, "a"), Point(2, "b")],)),
+     ((Record,),                        (Record(1, [Point(1, "a")]),)),
+     ((Node,),                          (Node(1, Node(2, Node(3))),)),
+     ((Movie,),                         ({"title": "a"},)),
+     ((Dict[str, Rating],),             ({"a": {"stars": 1}},)),
+     ((Tuple[Point, int],),             ((Point(True, "a"), 1),))])
+def test_accepts_fields(types, args):
+    foo = get_foo_params(*types)
+    assert(foo(*args))
+
+@pytest.mark.parametrize("types, expected, actual, args, path",
+    [((Point,),
+        r"Point[y: str]",            r"Point[y: int]",
+            (Point(1, 2),),                         (1,)),
+     ((List[Point],),
+        r"list[Point[x: int]]",      r"list[Point[x: str]]",
+            ([Point(1, "a"), Point("b", "c")],),    (1, 0)),
+     ((Record,),
+        r"Record[points: list[Point[y: str]]]",
+            r"Record[points: list[Point[y: float]]]",
+            (Record(1, [Point(1, 1.5)]),),          ("points", 0, 1)),
+     ((Node,),
+        r"Node[next: union[Node[next: union[Node[value: int], NoneType]], "
+        r"NoneType]]",
+        r"Node[next: union[Node[next: union[Node[value: str], NoneType]], "
+        r"NoneType]]",
+            (Node(1, Node(2, Node("a"))),),        ("next", "next", "value")),
+     ((Movie,),
+        r"Movie[year: int]",         r"Movie[year: str]",
+            ({"year": "1999"},),                    ("year",)),
+     ((Rating,),
+        r"Rating[stars: int]",       r"Rating[stars: missing]",
+            ({},),                                  ("stars",)),
+     ((Rating,),
+        r"dict",                     r"list",
+            ([],),                                  ())])
+def test_accepts_wrong_fields(types, expected, actual, args, path):
+    foo = get_foo_params(*types)
+    with pytest.raises(TypeError, match=get_error_regex(expected, actual)) \
+         as info:
+        foo(*args)
+    assert(info.value.path == path)
+
+@dataclasses.dataclass
+class Tree:
+    value: int
+    children: List["Tree"]
+
+@dataclasses.dataclass
+class Branch:
+    leaf: "Leaf"
+
+@dataclasses.dataclass
+class Leaf:
+    value: int
+    branch: typing.Optional[Branch] = None
+
+def test_accepts_deep_fields():
+    foo = get_foo_params(Node)
+    node = None
+    for i in range(5000):
+        node = Node(i, node)
+    assert(foo(node))
+    node.next.next.next.value = "a"
+    with pytest.raises(TypeError) as info:
+        foo(node)
+    assert(info.value.path == ("next", "next", "next", "value"))
+    assert(re.search(get_error_regex(
+               "Node[next: union[Node[next: union[Node[next: union["
+               "Node[value: int], NoneType]], NoneType]], NoneType]]",
+               "Node[next: union[Node[next: union[Node[next: union["
+               "Node[value: str], NoneType]], NoneType]], NoneType]]"),
+           str(info.value)))
+    # The first wrong value in the order of the fields is reported
+    foo = get_foo_params(Tree)
+    tree = Tree(1, [Tree(2, [Tree(3, [])]), Tree(4, [])])
+    assert(foo(tree))
+    tree.children[0].children[0].value = "a"
+    tree.children[1].value = "b"
+    with pytest.raises(TypeError) as info:
+        foo(tree)
+    assert(info.value.path == ("children", 0, "children", 0, "value"))
+    # Classes referring to each other
+    foo = get_foo_params(Branch)
+    branch = Branch(Leaf(1))
+    for i in range(3000):
+        branch = Branch(Leaf(i, branch))
+    assert(foo(branch))
+    branch.leaf.branch.leaf.value = "a"
+    with pytest.raises(TypeError) as info:
+        foo(branch)
+    assert(info.value.path == ("leaf", "branch", "leaf", "value"))
+
+@dataclasses.dataclass
+class Pair:
+    value: int
+    other: Union[Tuple["Pair", List[int]], Tuple[Any, List[str]], None] = \
+        None
+
+def test_accepts_deep_fields_union():
+    foo = get_foo_params(Pair)
+    # The values deferred by a member of a union that does not match are not
+    # checked
+    assert(foo(Pair(1, (Pair("a"), ["b"]))))
+    with pytest.raises(TypeError) as info:
+        foo(Pair(1, (Pair(2, (Pair("a"), [1])), [1])))
+    assert(info.value.path == ("other", 0, "other", 0, "value"))
+
+@dataclasses.dataclass
+class Early:
+    n: int
+    later: "Later"
+
+# Compiled before Later is defined
+check_early = get_foo_params(Early)
+
+@dataclasses.dataclass
+class Later:
+    value: int
+
+def test_accepts_fields_defined_later():
+    assert(check_early(Early(1, Later(1))))
+    with pytest.raises(TypeError) as info:
+        check_early(Early(1, Later("a")))
+    assert(info.value.path == ("later", "value"))
+    with pytest.raises(TypeError) as info:
+        check_early(Early("a", Later(1)))
+    assert(info.value.path == ("n",))
+
+def test_field_plan_cached():
+    from typechecker import typecheck
+    typecheck._field_plans.pop(Point, None)
+    assert(typecheck._field_plan(Point) ==
+           ("index", (("x", 0, int, True), ("y", 1, str, True))))
+    assert(typecheck._field_plans[Point] is typecheck._field_plan(Point))
+    assert(typecheck._field_plan(Bar) is None)
+    assert(typecheck._field_plan(collections.namedtuple("P", "a b")) is None)
@@ -0,0 +1,183 @@
+"""Expected types for arrays and buffers : numpy arrays (NDArray), arrays of
+the array module (Array) and any object supporting the buffer protocol, such
+as memoryview, bytes or bytearray (Buffer).
+They are checked by comparing a few attributes (dtype, typecode, format,
+shape), without iterating over the elements nor copying them, so the check
+costs the same whatever the size of the array.
+numpy is only imported when an NDArray type is compiled.
+
+Example :
+    @accepts(NDArray[float, (None, 3)], Array["i"], Buffer["B"])
+    def foo(points, indices, data):
+        ...
+"""
+import array
+from typing import Any
+
+from typechecker.typecheck import TypeSpec, _Context, _Mismatch
+
+def _import_numpy():
+    """Import numpy, which is only needed to check numpy arrays.
+    Returns:
+        module:
+            The numpy module
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required to check NDArray types") \
+              from None
+    return numpy
+
+def _shape_matches(shape, expected):
+    """Check if the shape of an array matches the expected one.
+    Parameters:
+        shape - tuple[int]:
+            The shape of the array
+        expected - tuple[int or None]:
+            The expected shape, None meaning any size along the dimension
+    Returns:
+        bool:
+            True if the shape matches
+    """
+    if len(shape) != len(expected):
+        return False
+    for size, size_expected in zip(shape, expected):
+        if size_expected is not None and size != size_expected:
+            return False
+    return True
+
+class NDArray(TypeSpec):
+    """A numpy array with a given dtype, and optionally a given shape.
+    Examples :
+        NDArray[numpy.float64]
+            Any array of float64
+        NDArray[float, (None, 3)]
+            2D arrays of float64 with 3 columns
+        NDArray[Any, (3,)]
+            1D arrays of 3 elements of any dtype
+    Parameters:
+        dtype - unknown:
+            Anything numpy.dtype accepts, or Any
+        shape - tuple[int or None] or None:
+            The expected shape, None meaning any size along a dimension. If
+            not given, any shape is accepted
+    """
+    name = "ndarray"
+
+    def __init__(self, dtype=Any, shape=None):
+        params = (dtype,) if shape is None else (dtype, tuple(shape))
+        super().__init__(*params)
+        self.dtype = dtype
+        self.shape = None if shape is None else tuple(shape)
+
+    @property
+    def origin(self):
+        return _import_numpy().ndarray
+
+    def compile_children(self, context):
+        numpy = _import_numpy()
+        dtype = None if self.dtype is Any else numpy.dtype(self.dtype)
+        shape = self.shape
+        new_context = _Context(context, self)
+        expected = ["any" if dtype is None else str(dtype)]
+        if shape is not None:
+            expected.append(str(shape))
+
+        def fail(arg):
+            actual = [str(arg.dtype)]
+            if shape is not None:
+                actual.append(str(arg.shape))
+            raise _Mismatch(expected, actual, new_context)
+
+        if shape is None:
+            if dtype is None:
+                return None
+
+            def check_dtype(arg):
+                if arg.dtype != dtype:
+                    fail(arg)
+            return check_dtype
+
+        def check_ndarray(arg):
+            if (dtype is not None and arg.dtype != dtype) or \
+               not _shape_matches(arg.shape, shape):
+                fail(arg)
+        return check_ndarray
+
+class Array(TypeSpec):
+    """An array of the array module with a given typecode (e.g. Array["d"]
+    for an array of double).
+    Parameters:
+        typecode - str:
+            The expected typecode
+    """
+    name = "array"
+    origin = array.array
+
+    def __init__(self, typecode):
+        if typecode not in array.typecodes:
+            raise ValueError("Unknown typecode '" + str(typecode) + "'")
+        super().__init__(typecode)
+        self.typecode = typecode
+
+    def compile_children(self, context):
+        typecode = self.typecode
+        new_context = _Context(context, self)
+
+        def check_typecode(arg):
+            if arg.typecode != typecode:
+                raise _Mismatch([typecode], [arg.typecode], new_context)
+        return check_typecode
+
+class Buffer(TypeSpec):
+    """Any object supporting the buffer protocol (memoryview, bytes,
+    bytearray, array.array, numpy arrays...), with a given format and
+    optionally a given shape. The object is inspected through a memoryview,
+    which does not copy the data.
+    Examples :
+        Buffer["B"]
+            Any buffer of unsigned bytes
+        Buffer["d", (None, 3)]
+            2D buffers of double with 3 columns
+        Buffer[Any]
+            Any buffer
+    Parameters:
+        format - str or Any:
+            The expected format, in the struct module syntax
+        shape - tuple[int or None] or None:
+            The expected shape, None meaning any size along a dimension. If
+            not given, any shape is accepted
+    """
+    name = "buffer"
+
+    def __init__(self, format=Any, shape=None):
+        params = (format,) if shape is None else (format, tuple(shape))
+        super().__init__(*params)
+        # The native byte order is the default, "@d" is the same as "d"
+        self.format = format if format is Any else format.lstrip("@")
+        self.shape = None if shape is None else tuple(shape)
+
+    def compile_children(self, context):
+        format = self.format
+        shape = self.shape
+        new_context = _Context(context, self)
+        expected = ["any" if format is Any else format]
+        if shape is not None:
+            expected.append(str(shape))
+
+        def check_buffer(arg):
+            try:
+                view = memoryview(arg)
+            except TypeError:
+                raise _Mismatch(["buffer"], [type(arg)], context) \
+                      from None
+            with view:
+                if (format is not Any and view.format.lstrip("@") != format) \
+                   or (shape is not None and
+                       not _shape_matches(view.shape, shape)):
+                    actual = [view.format.lstrip("@")]
+                    if shape is not None:
+                        actual.append(str(view.shape))
+                    raise _Mismatch(expected, actual, new_context)
+        return check_buffer
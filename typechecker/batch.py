@@ -0,0 +1,77 @@
+"""Check batches of records of the same type, such as the rows read from a
+file. A list of records is checked in a single pass by the compiled checker
+of a list of records, and the error raised is the one of a decorator
+expecting that list. numpy structured arrays are checked from their dtype,
+without looking at the records.
+
+Example :
+    validate_batch(rows, Tuple[int, str, float])
+    validate_batch(rows, Dict[str, int])
+    validate_batch(table, Tuple[int, float])  # numpy structured array
+"""
+import sys
+import typing
+from typing import List
+
+from typechecker.typecheck import compile_type, error_msg, get_name, \
+                                  get_type_info, run_checker
+
+# Kinds of the numpy dtypes matching the fields of a schema
+_dtype_kinds = {bool: "b", int: "iu", float: "f", complex: "c", str: "U",
+                bytes: "S"}
+
+def _validate_array(records, schema):
+    """Check a numpy structured array (or a 2D array, each row being a
+    record) against a schema of plain types, from its dtype only.
+    Parameters:
+        records - numpy.ndarray:
+            The records
+        schema - typing._GenericAlias:
+            The expected type of each record, a tuple of types
+    Returns:
+        None
+    """
+    args = typing.get_args(schema)
+    if get_type_info(schema)[2] is not tuple or not args or \
+       any(x not in _dtype_kinds for x in args):
+        raise NotImplementedError("Only the schemas made of a tuple of "
+                                  + ", ".join(x.__name__
+                                              for x in _dtype_kinds)
+                                  + " are supported for arrays")
+    dtype = records.dtype
+    if dtype.names is not None and records.ndim == 1:
+        fields = [dtype.fields[x][0] for x in dtype.names]
+    elif dtype.names is None and records.ndim == 2:
+        fields = [dtype] * records.shape[1]
+    else:
+        fields = None
+    if fields is not None and len(fields) == len(args) and \
+       all(x.kind in _dtype_kinds[y] for x, y in zip(fields, args)):
+        return
+    actual = [str(records.shape)] if fields is None else \
+             [str(x) for x in fields]
+    raise TypeError(error_msg("validate_batch", 0,
+                              [get_name(x) for x in args], actual,
+                              ("ndarray[", "]")))
+
+def validate_batch(records, schema):
+    """Check that all the records of a batch have the type 'schema', raising
+    the TypeError of accepts(List[schema]) for the first wrong record.
+    numpy structured arrays (or 2D arrays) are checked from their dtype
+    against a schema made of a tuple of plain types (bool, int, float,
+    complex, str, bytes).
+    Parameters:
+        records - iterable:
+            The records (e.g. a list of tuples or a list of dicts)
+        schema - type or typing._GenericAlias:
+            The expected type of each record (e.g. Tuple[int, str, float] or
+            Dict[str, int])
+    Returns:
+        None
+    """
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(records, numpy.ndarray):
+        return _validate_array(records, schema)
+    if not isinstance(records, list):
+        records = list(records)
+    run_checker(compile_type(List[schema]), "validate_batch", 0, records)
@@ -0,0 +1,199 @@
+"""Lists, dicts and sets checking their elements when they are added, rather
+than each time they are given to a decorated function. A checked container
+is built by subscription with the type of its elements, and raises a
+TypeError as soon as a wrong element is inserted. The decorators recognize
+the checked containers whose element types are the expected ones, and accept
+them without looking at their elements : the cost of the check moves from
+each call to each mutation. The elements that can be mutated in place (e.g.
+the lists of a CheckedList[List[int]]) are still checked by the decorators.
+
+Example :
+    values = CheckedList[Tuple[str, int]]([("a", 1)])
+    values.append(("b", 2))
+    values.append(("c", 2.5))  # TypeError
+
+    @accepts(List[Tuple[str, int]])
+    def foo(values):  # values is not scanned
+        ...
+"""
+from typing import List, Dict, Set
+
+from typechecker.typecheck import compile_type, run_checker
+
+# Checked container classes, indexed by the base class and the types of the
+# elements (see _Checked.__class_getitem__)
+_classes = {}
+
+def _rebuild(base, types, data):
+    """Build a checked container again, when it is unpickled.
+    Parameters:
+        base - type:
+            CheckedList, CheckedDict or CheckedSet
+        types - tuple:
+            The types of the elements
+        data - list, dict or set:
+            The elements
+    Returns:
+        list, dict or set:
+            The checked container
+    """
+    return base[types](data)
+
+class _Checked:
+    """Base of the checked containers. The subscription (e.g.
+    CheckedList[int]) returns a subclass whose '_checked_types' attribute
+    holds the types of the elements, which the decorators compare with the
+    expected ones.
+    Attributes:
+        _checked_types - tuple or None:
+            The types of the elements (the key and value types for a dict),
+            None for the unsubscripted classes
+    """
+    _checked_types = None
+    # The type of a container of these elements, from the types
+    _container = None
+
+    def __class_getitem__(cls, types):
+        if not isinstance(types, tuple):
+            types = (types,)
+        try:
+            return _classes[(cls, types)]
+        except KeyError:
+            pass
+        name = cls.__name__ + "[" + ", ".join(
+            x.__name__ if isinstance(x, type) else repr(x)
+            for x in types) + "]"
+        checked = type(name, (cls,), {"_checked_types": types,
+                                      "__module__": cls.__module__})
+        checked._checker = staticmethod(
+            compile_type(cls._container[types if len(types) > 1
+                                        else types[0]]))
+        _classes[(cls, types)] = checked
+        return checked
+
+    @classmethod
+    def _check(cls, values, method):
+        """Check a container of new elements.
+        Parameters:
+            values - list, dict or set:
+                The new elements, in a container of the base type
+            method - str:
+                The name of the method adding them, for the error message
+        Returns:
+            None
+        """
+        if cls._checked_types is None:
+            raise TypeError(cls.__name__ + " must be given the type of its "
+                            + "elements, e.g. " + cls.__name__ + "[int]")
+        run_checker(cls._checker, method, 0, values)
+
+    def __reduce__(self):
+        base = type(self).__mro__[1]
+        return (_rebuild, (base, self._checked_types, self._base(self)))
+
+class CheckedList(_Checked, list):
+    """A list checking the elements added to it (see the module
+    documentation).
+    Example :
+        CheckedList[int]([1, 2])
+    """
+    _container = List
+    _base = list
+
+    def __init__(self, values=()):
+        values = list(values)
+        self._check(values, "__init__")
+        super().__init__(values)
+
+    def append(self, value):
+        self._check([value], "append")
+        super().append(value)
+
+    def insert(self, index, value):
+        self._check([value], "insert")
+        super().insert(index, value)
+
+    def extend(self, values):
+        values = list(values)
+        self._check(values, "extend")
+        super().extend(values)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._check(value, "__setitem__")
+        else:
+            self._check([value], "__setitem__")
+        super().__setitem__(index, value)
+
+class CheckedDict(_Checked, dict):
+    """A dict checking the key-value pairs added to it (see the module
+    documentation).
+    Example :
+        CheckedDict[str, int]({"a": 1})
+    """
+    _container = Dict
+    _base = dict
+
+    def __init__(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self._check(values, "__init__")
+        super().__init__(values)
+
+    def __setitem__(self, key, value):
+        self._check({key: value}, "__setitem__")
+        super().__setitem__(key, value)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self._check(values, "update")
+        super().update(values)
+
+    def __ior__(self, values):
+        self.update(values)
+        return self
+
+class CheckedSet(_Checked, set):
+    """A set checking the elements added to it (see the module
+    documentation).
+    Example :
+        CheckedSet[int]({1, 2})
+    """
+    _container = Set
+    _base = set
+
+    def __init__(self, values=()):
+        values = set(values)
+        self._check(values, "__init__")
+        super().__init__(values)
+
+    def add(self, value):
+        self._check({value}, "add")
+        super().add(value)
+
+    def update(self, *others):
+        values = set().union(*others)
+        self._check(values, "update")
+        super().update(values)
+
+    def __ior__(self, values):
+        self.update(values)
+        return self
+
+    def symmetric_difference_update(self, values):
+        values = set(values)
+        self._check(values, "symmetric_difference_update")
+        super().symmetric_difference_update(values)
+
+    def __ixor__(self, values):
+        self.symmetric_difference_update(values)
+        return self
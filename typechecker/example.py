@@ -7,7 +7,7 @@ class Foo:
 class Bar:
     def __init__(self):
         pass
-    @accepts(Any, int)
+    @accepts(int)
     def foo(self, arg):
         return "ok"
 
@@ -56,3 +56,38 @@ def foo9(arg):
 @accepts(int, x=int, y=int)
 def foo10(arg, x=1, y=1):
     return "ok"
+
+@accepts(str, values=int)
+def foo10b(name, *values):
+    return "ok"
+
+# Example 11
+@accepts(List[int], sample=64)
+def foo11(arg):
+    return "ok"
+
+# Example 13
+@returns(typing.Iterator[int])
+def foo13(arg):
+    return iter(arg)
+
+# Example 14
+@typechecked
+def foo14(arg: List[int], *args: str) -> int:
+    return len(arg)
+
+# Example 15
+@accepts(int)
+@returns(List[int])
+async def foo15(arg):
+    return [arg]
+
+@returns(typing.AsyncIterator[int])
+async def foo15b(arg):
+    for x in arg:
+        yield x
+
+# Example 16
+@accepts(typing.Sequence[int], typing.Mapping[str, int])
+def foo16(values, counts):
+    return "ok"
@@ -0,0 +1,412 @@
+"""Check the records of large JSON Lines and CSV files against a schema
+written with the types of the typing module, from the command line. The file
+is memory-mapped and cut into chunks of whole lines, checked by a pool of
+processes : each worker only holds one chunk at a time, whatever the size of
+the file. The records of a chunk are checked at once, as a list, and one
+by one only once a wrong record is known to exist, to report every
+violation with its line number.
+
+Examples :
+    typecheck-file events.jsonl "Dict[str, Union[int, str]]"
+    typecheck-file points.csv "Tuple[int, float, float]" --workers 8
+    python -m typechecker.files dump.jsonl myapp.models:Record
+"""
+import argparse
+import ast
+import concurrent.futures
+import csv
+import importlib
+import json
+import mmap
+import os
+import sys
+import time
+import typing
+
+from typechecker.typecheck import _Mismatch, _field_plan, compile_type, \
+                                  get_name, get_type_info, render_context
+
+# Schemas already loaded, indexed by their text (see _load_schema)
+_schemas = {}
+
+# Names a schema expression can use : those of the typing module and the
+# builtin types
+_schema_names = dict({x: getattr(typing, x) for x in typing.__all__},
+                     bool=bool, int=int, float=float, complex=complex,
+                     str=str, bytes=bytes, list=list, tuple=tuple, dict=dict,
+                     set=set, frozenset=frozenset, object=object)
+
+# Syntax allowed in a schema expression : names, subscriptions, the unions
+# written with |, and constants (e.g. None or the forward references)
+_schema_nodes = (ast.Expression, ast.Name, ast.Load, ast.Subscript,
+                 ast.Tuple, ast.List, ast.Constant, ast.BinOp, ast.BitOr)
+
+def _parse_schema(text):
+    """Evaluate a schema expression, made of the names of the typing module
+    and of the builtin types only (see _schema_names). The expression is
+    checked before it is evaluated, so that a schema cannot run any code.
+    Parameters:
+        text - str:
+            The expression (e.g. "Dict[str, int]")
+    Returns:
+        type or typing._GenericAlias:
+            The type
+    """
+    tree = ast.parse(text, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _schema_nodes):
+            raise ValueError("unsupported syntax " + type(node).__name__)
+        if isinstance(node, ast.Name) and node.id not in _schema_names:
+            raise ValueError("unknown name " + node.id)
+    return eval(compile(tree, "<schema>", "eval"), {"__builtins__": {}},
+                dict(_schema_names))
+
+def _load_schema(text):
+    """Get the type described by a schema given on the command line : either
+    an expression using the names of the typing module and the builtin
+    types (e.g. "Dict[str, int]", see _parse_schema), or the path of a type
+    defined in a module (e.g. "myapp.models:Record").
+    Parameters:
+        text - str:
+            The schema
+    Returns:
+        type or typing._GenericAlias:
+            The type
+    """
+    try:
+        return _schemas[text]
+    except KeyError:
+        pass
+    module_name, sep, name = text.partition(":")
+    if sep:
+        schema = importlib.import_module(module_name)
+        for attr in name.split("."):
+            schema = getattr(schema, attr)
+    else:
+        schema = _parse_schema(text)
+    _schemas[text] = schema
+    return schema
+
+def _converter(typ):
+    """Get the function converting a CSV field (a string) into a value of
+    the type 'typ'. The numbers and booleans are converted, an empty field
+    is None if the type accepts it, and the fields that cannot be converted
+    are kept as strings, so that they are reported by the check.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type of the field
+    Returns:
+        function:
+            The function converting a field
+    """
+    name, kind, origin = get_type_info(typ)
+    if kind == "union":
+        members = typing.get_args(typ)
+        # str last, so that the other types get a chance to convert
+        converters = [_converter(x) for x in members if x is not str]
+        nullable = type(None) in members
+        def convert(field):
+            if not field and nullable:
+                return None
+            for converter in converters:
+                value = converter(field)
+                if value is not field:
+                    return value
+            return field
+        return convert
+    if typ is bool:
+        booleans = {"true": True, "false": False, "1": True, "0": False}
+        return lambda field: booleans.get(field.lower(), field)
+    if typ in (int, float, complex):
+        def convert(field):
+            try:
+                return typ(field)
+            except ValueError:
+                return field
+        return convert
+    if typ is type(None):
+        return lambda field: None if not field else field
+    return lambda field: field
+
+def _csv_record(schema, header):
+    """Get the function building a record from the fields of a CSV row :
+    a tuple for a schema Tuple[...], a dict indexed by the column names
+    for a schema Dict[str, ...] or a TypedDict, a list otherwise.
+    Parameters:
+        schema - type or typing._GenericAlias:
+            The expected type of each record
+        header - list[str]:
+            The names of the columns
+    Returns:
+        function:
+            The function building a record from a list of fields
+    """
+    name, kind, origin = get_type_info(schema)
+    args = typing.get_args(schema)
+    if origin is tuple and args:
+        converters = [_converter(x) for x in args]
+        return lambda row: tuple(f(x) for f, x in zip(converters, row)) \
+                           + tuple(row[len(converters):])
+    if origin is dict and args:
+        convert = _converter(args[1])
+        return lambda row: dict(zip(header, map(convert, row)))
+    plan = _field_plan(schema)
+    if plan is not None and plan[0] == "key":
+        # Each column of a TypedDict has its own type
+        types = {x[0]: x[2] for x in plan[1] or ()}
+        converters = [_converter(types.get(x, str)) for x in header]
+        return lambda row: {x: f(y) for x, f, y in zip(header, converters,
+                                                       row)}
+    if kind == "generic" and args:
+        convert = _converter(args[0])
+        return lambda row: list(map(convert, row))
+    return list
+
+def _describe(mismatch):
+    """Describe a wrong record on a single line.
+    Parameters:
+        mismatch - _Mismatch:
+            The error raised by the checker of the schema
+    Returns:
+        str:
+            The description (e.g. "expected dict[str, int], have dict[str,
+            str] at ['b']")
+    """
+    expected, actual, context = mismatch.args
+    left, right = render_context(context)
+    expected = ", ".join(x if isinstance(x, str) else get_name(x)
+                         for x in expected)
+    actual = ", ".join(x if isinstance(x, str) else get_name(x)
+                       for x in actual)
+    msg = "expected " + left + expected + right + ", have " + left \
+          + actual + right
+    if mismatch.path:
+        msg += " at " + "".join("[" + repr(x) + "]"
+                                for x in reversed(mismatch.path))
+    return msg
+
+def _check_chunk(task):
+    """Check the records of a chunk of the file. This runs in the workers :
+    the chunk is read from the file, rather than sent by the main process.
+    Parameters:
+        task - tuple:
+            (path, start, end, file_format, schema, header, max_violations)
+            where start and end are the offsets of the chunk in the file,
+            file_format is "json" or "csv", schema the text of the schema,
+            header the names of the CSV columns and max_violations the
+            number of violations to report at most
+    Returns:
+        tuple:
+            (lines, records, violations, reported) where lines is the number
+            of lines of the chunk, records the number of records, violations
+            the number of wrong records, and reported a list of (line,
+            message) for the first wrong ones, line counting from 0 at the
+            start of the chunk
+    """
+    path, start, end, file_format, schema, header, max_violations = task
+    schema = _load_schema(schema)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            chunk = mapped[start:end]
+    lines = chunk.split(b"\n")
+    if not lines[-1]:
+        lines.pop()
+    numbers = [i for i, x in enumerate(lines) if x.strip()]
+    count = len(numbers)
+    reported = []
+    violations = 0
+    if file_format == "json":
+        records = []
+        # The unreadable lines are reported here, and left out of the check
+        parsed = []
+        for i in numbers:
+            try:
+                records.append(json.loads(lines[i]))
+            except ValueError as e:
+                violations += 1
+                if len(reported) < max_violations:
+                    reported.append((i, "invalid JSON : " + str(e)))
+                continue
+            parsed.append(i)
+        numbers = parsed
+        # JSON has no tuples : the arrays stand for the tuples of the schema
+        if get_type_info(schema)[2] is tuple:
+            records = [tuple(x) if type(x) is list else x for x in records]
+    else:
+        make_record = _csv_record(schema, header)
+        rows = csv.reader(lines[i].decode("utf-8") for i in numbers)
+        records = [make_record(x) for x in rows]
+    try:
+        compile_type(typing.List[schema])(records)
+        first = None
+    except _Mismatch as e:
+        # The outermost position is the index of the record
+        first = e.path[-1]
+    if first is not None:
+        checker = compile_type(schema)
+        for i in range(first, len(records)):
+            try:
+                checker(records[i])
+            except _Mismatch as e:
+                violations += 1
+                if len(reported) < max_violations:
+                    reported.append((numbers[i], _describe(e)))
+        reported.sort()
+    return (len(lines), count, violations, reported)
+
+def _chunks(mapped, start, chunk_size):
+    """Cut a memory-mapped file into chunks of whole lines.
+    Parameters:
+        mapped - mmap.mmap:
+            The file
+        start - int:
+            The offset of the first chunk
+        chunk_size - int:
+            The size of the chunks in bytes, before they are extended to the
+            end of their last line
+    Returns:
+        generator:
+            The (start, end) offsets of the chunks
+    """
+    size = len(mapped)
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            end = mapped.find(b"\n", end - 1)
+            end = size if end == -1 else end + 1
+        yield (start, end)
+        start = end
+
+def validate_file(path, schema, file_format=None, workers=None,
+                  chunk_size=1 << 20, max_violations=100, output=None):
+    """Check the records of a JSON Lines or CSV file against a schema, and
+    print the violations (at most 'max_violations') with their line number.
+    The records of a CSV file are built from its fields, converted to the
+    numbers and booleans of the schema : a tuple per row for a schema
+    Tuple[...], a dict indexed by the column names of the first line for a
+    schema Dict[str, ...]. The CSV fields must not contain line breaks. The
+    JSON arrays are taken as tuples if the schema is a tuple. A schema that
+    cannot be read or checked raises a ValueError, before any record is
+    read.
+    Parameters:
+        path - str:
+            The path of the file
+        schema - str:
+            The schema (see _load_schema)
+        file_format - str or None:
+            "json" or "csv", or None to guess it from the extension of the
+            file
+        workers - int or None:
+            The number of processes, None for the number of CPUs. With 1,
+            the chunks are checked in the current process
+        chunk_size - int:
+            The size in bytes of the chunks given to the workers
+        max_violations - int:
+            The number of violations to print at most
+        output - file or None:
+            Where the violations are printed, sys.stdout if None
+    Returns:
+        tuple:
+            (records, violations) where records is the number of records
+            checked and violations the number of wrong records
+    """
+    if output is None:
+        output = sys.stdout
+    if file_format is None:
+        file_format = "csv" if path.lower().endswith(".csv") else "json"
+    if file_format not in ("json", "csv"):
+        raise ValueError("The format must be 'json' or 'csv'")
+    # Fail early on a wrong or unsupported schema, rather than in each
+    # worker
+    try:
+        compile_type(typing.List[_load_schema(schema)])
+    except Exception as e:
+        raise ValueError("Invalid schema '" + schema + "' : " + str(e)) \
+              from None
+    records = violations = reported = 0
+    if os.path.getsize(path) == 0:
+        return (records, violations)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = line = 0
+            header = None
+            if file_format == "csv":
+                start = mapped.find(b"\n") + 1 or len(mapped)
+                header = next(csv.reader([mapped[:start].decode("utf-8")]),
+                              [])
+                line = 1
+            tasks = [(path, x, y, file_format, schema, header,
+                      max_violations) for x, y in _chunks(mapped, start,
+                                                          chunk_size)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(tasks) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            min(workers, len(tasks)))
+        results = executor.map(_check_chunk, tasks)
+    else:
+        results = map(_check_chunk, tasks)
+    try:
+        for lines, chunk_records, chunk_violations, chunk_reported in results:
+            for i, msg in chunk_reported:
+                if reported < max_violations:
+                    output.write(path + ":" + str(line + i + 1) + ": " + msg
+                                 + "\n")
+                    reported += 1
+            records += chunk_records
+            violations += chunk_violations
+            line += lines
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return (records, violations)
+
+def main(argv=None):
+    """Entry point of the typecheck-file command (see the module
+    documentation). The exit status is 1 if a record is wrong.
+    Parameters:
+        argv - list[str] or None:
+            The arguments, sys.argv[1:] if None
+    Returns:
+        int:
+            The exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog="typecheck-file",
+        description="Check the records of a JSON Lines or CSV file against "
+                    "a schema.")
+    parser.add_argument("path", help="the JSON Lines or CSV file")
+    parser.add_argument("schema",
+                        help="the type of each record, e.g. 'Dict[str, "
+                             "int]' or 'myapp.models:Record'")
+    parser.add_argument("--format", choices=("json", "csv"),
+                        help="the format of the file (default: from its "
+                             "extension)")
+    parser.add_argument("--workers", type=int,
+                        help="the number of processes (default: the number "
+                             "of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20,
+                        help="the size in bytes of the chunks given to the "
+                             "workers")
+    parser.add_argument("--max-violations", type=int, default=100,
+                        help="the number of violations to print at most")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    try:
+        records, violations = validate_file(args.path, args.schema,
+                                            args.format, args.workers,
+                                            args.chunk_size,
+                                            args.max_violations)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("%d records, %d violations in %.2fs (%.0f records/s)\n"
+                     % (records, violations, elapsed,
+                        records / elapsed if elapsed else 0))
+    return 1 if violations else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Type check whole classes, modules and packages from their annotations,
+without decorating each function by hand. Every function with annotations is
+decorated with typechecked, which resolves the annotations and compiles the
+checkers on the first call only : instrumenting a module only costs a
+wrapper per function, whatever the number of functions that are never
+called. The annotations that cannot be resolved (e.g. names imported under
+typing.TYPE_CHECKING) or checked (e.g. Callable[[int], int]) are not checked,
+with a RuntimeWarning, instead of making the calls fail.
+
+Examples :
+    typecheck_class(Foo)
+        Check the methods of Foo
+    typecheck_module("myapp.models")
+        Check the functions and classes defined in myapp.models
+    typecheck_package("myapp")
+        Check all the modules of the package myapp
+    install_import_hook("myapp.rpc", "myapp.models")
+        Check the modules of these packages when they are imported
+"""
+import importlib
+import importlib.abc
+import pkgutil
+import sys
+import types
+
+from typechecker.typecheck import _typechecked
+
+def _needs_check(f):
+    """Detect if a function should be decorated : it must have annotations
+    and not be checked already.
+    Parameters:
+        f - function:
+            The function
+    Returns:
+        bool:
+            True if the function should be decorated
+    """
+    return isinstance(f, types.FunctionType) and \
+           bool(getattr(f, "__annotations__", None)) and \
+           not getattr(f, "_typechecked", False)
+
+def _instrument(attr, sample):
+    """Decorate a class attribute if it is a function to check.
+    Parameters:
+        attr - unknown:
+            The attribute
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    Returns:
+        unknown:
+            The decorated attribute, or None if it is left as is
+    """
+    if _needs_check(attr):
+        return _typechecked(attr, sample, False)
+    if isinstance(attr, (staticmethod, classmethod)) and \
+       _needs_check(attr.__func__):
+        return type(attr)(_typechecked(attr.__func__, sample, False))
+    if isinstance(attr, property):
+        accessors = [_typechecked(x, sample, False) if _needs_check(x)
+                     else x for x in (attr.fget, attr.fset, attr.fdel)]
+        if accessors != [attr.fget, attr.fset, attr.fdel]:
+            return attr.getter(accessors[0]).setter(accessors[1]) \
+                       .deleter(accessors[2])
+    return None
+
+def typecheck_class(cls, sample=None):
+    """Check the methods defined in a class (including static methods, class
+    methods, properties and the methods of the nested classes) from their
+    annotations.
+    Parameters:
+        cls - type:
+            The class
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    Returns:
+        type:
+            The class, so that the function can be used as a class decorator
+    """
+    # The __new__ generated for a NamedTuple cannot resolve its annotations
+    # when they are postponed, and its fields are checked by the decorators
+    # anyway
+    named_tuple = issubclass(cls, tuple) and hasattr(cls, "_fields")
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, type) and attr.__module__ == cls.__module__ and \
+           attr.__qualname__.startswith(cls.__qualname__ + "."):
+            typecheck_class(attr, sample)
+            continue
+        if named_tuple and name == "__new__":
+            continue
+        decorated = _instrument(attr, sample)
+        if decorated is not None:
+            setattr(cls, name, decorated)
+    return cls
+
+def typecheck_module(module, sample=None):
+    """Check the functions and the classes defined in a module from their
+    annotations. The functions and classes imported from other modules are
+    left as is.
+    Parameters:
+        module - module or str:
+            The module, or its name
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    Returns:
+        module:
+            The module
+    """
+    if isinstance(module, str):
+        module = importlib.import_module(module)
+    for name, attr in list(vars(module).items()):
+        if getattr(attr, "__module__", None) != module.__name__:
+            continue
+        if isinstance(attr, type):
+            typecheck_class(attr, sample)
+        elif _needs_check(attr):
+            setattr(module, name, _typechecked(attr, sample, False))
+    return module
+
+def typecheck_package(package, sample=None):
+    """Check all the modules of a package (see typecheck_module). The
+    modules that are not imported yet are imported.
+    Parameters:
+        package - module or str:
+            The package, or its name
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    Returns:
+        list[module]:
+            The modules checked
+    """
+    if isinstance(package, str):
+        package = importlib.import_module(package)
+    modules = [typecheck_module(package, sample)]
+    for info in pkgutil.walk_packages(getattr(package, "__path__", []),
+                                      package.__name__ + "."):
+        modules.append(typecheck_module(info.name, sample))
+    return modules
+
+class _TypecheckLoader(importlib.abc.Loader):
+    """Loader checking the module it loads (see typecheck_module), right
+    after running its code with the original loader.
+    Parameters:
+        loader - importlib.abc.Loader:
+            The original loader
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    """
+    def __init__(self, loader, sample):
+        self._loader = loader
+        self._sample = sample
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._loader.exec_module(module)
+        typecheck_module(module, self._sample)
+
+    def __getattr__(self, name):
+        # The other methods (get_source, get_resource_reader...) are those
+        # of the original loader
+        return getattr(self._loader, name)
+
+class _TypecheckFinder(importlib.abc.MetaPathFinder):
+    """Finder checking the modules of some packages when they are imported
+    (see install_import_hook). The modules are found by the other finders,
+    only their loader is replaced.
+    Parameters:
+        prefixes - tuple[str]:
+            The names of the modules or packages to check
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    """
+    def __init__(self, prefixes, sample):
+        self.prefixes = prefixes
+        self.sample = sample
+
+    def find_spec(self, fullname, path, target=None):
+        if not any(fullname == x or fullname.startswith(x + ".")
+                   for x in self.prefixes):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TypecheckLoader(spec.loader, self.sample)
+        return spec
+
+def install_import_hook(*prefixes, sample=None):
+    """Check the modules of some packages when they are imported (see
+    typecheck_module). The modules already imported are not affected.
+    Parameters:
+        prefixes - tuple[str]:
+            The names of the modules or packages to check (e.g. "myapp.rpc"
+            checks myapp.rpc and all its submodules)
+        sample - int or None:
+            The sample size of the decorators (see typechecked)
+    Returns:
+        importlib.abc.MetaPathFinder:
+            The hook, to give to uninstall_import_hook
+    """
+    if not prefixes:
+        raise ValueError("At least one module or package name is required")
+    finder = _TypecheckFinder(prefixes, sample)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+def uninstall_import_hook(finder):
+    """Stop checking the modules imported afterwards (see
+    install_import_hook). The modules already checked stay checked.
+    Parameters:
+        finder - importlib.abc.MetaPathFinder:
+            The hook returned by install_import_hook
+    Returns:
+        None
+    """
+    if finder in sys.meta_path:
+        sys.meta_path.remove(finder)
@@ -1,20 +1,156 @@
+import atexit
+import collections
+import collections.abc
+import concurrent.futures
+import dataclasses
 import functools
+import hashlib
+import inspect
+import itertools
+import json
+import logging
+import operator
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+import types
 import typing
+import warnings
+import weakref
 from typing import List, Tuple, Dict, Set, Any, Union
-import re
+
+class TypeSpec:
+    """Base class of the expected types that do not come from the typing
+    module (e.g. typechecker.arrays.NDArray). The compiler asks a TypeSpec
+    for its checker once, like it does for the generic aliases.
+    Subclasses set 'name' and 'origin' and implement compile_children. They
+    are usually built by subscription (e.g. NDArray[float]), the parameters
+    being kept in 'params'.
+    Attributes:
+        name - str:
+            The name of the type in the error messages
+        origin - type or None:
+            The type a value must have, or None if the checker built by
+            compile_children checks it itself
+        params - tuple:
+            The parameters of the type
+    """
+    name = None
+    origin = None
+
+    def __init__(self, *params):
+        self.params = params
+
+    def __class_getitem__(cls, params):
+        if not isinstance(params, tuple):
+            params = (params,)
+        return cls(*params)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.params == other.params
+
+    def __hash__(self):
+        return hash((type(self), self.params))
+
+    def __repr__(self):
+        return (type(self).__name__ + "["
+                + ", ".join(repr(x) for x in self.params) + "]")
+
+    def compile_children(self, context):
+        """Build the checker of a value whose type is already known to be
+        'origin'.
+        Parameters:
+            context - _Context or None:
+                The position of the type in the type architecture, to give to
+                the _Mismatch raised (usually _Context(context, self), to
+                render the error as "name[...]")
+        Returns:
+            function or None:
+                A function taking the value as single argument and raising a
+                _Mismatch if it does not match, or None if there is nothing
+                more to check
+        """
+        raise NotImplementedError
+
+# Name, kind and origin of the types already seen, indexed by the type object
+# (see get_type_info)
+_type_info = {}
+
+def _resolve_type_info(typ):
+    """Compute the information returned by get_type_info, using the structure
+    of the type (typing.get_origin) rather than its string representation.
+    Parameters:
+        typ - type or type from the typing module:
+            The type to inspect
+    Returns:
+        tuple:
+            See get_type_info
+    """
+    if typ is Any:
+        return ("any", "any", None)
+    if typ is Union:
+        return ("union", "union", None)
+    if typ is None:
+        return ("NoneType", "type", None)
+    if isinstance(typ, TypeSpec):
+        return (typ.name, "spec", typ.origin)
+    origin = typing.get_origin(typ)
+    if origin is Union or origin is types.UnionType:
+        return ("union", "union", Union)
+    if origin is not None:
+        return (getattr(origin, "__name__", str(origin)).lower(),
+                "generic",
+                origin)
+    if isinstance(typ, type):
+        return (typ.__name__, "type", None)
+    # Remaining special forms of the typing module (e.g. typing.NoReturn)
+    name = getattr(typ, "_name", None)
+    if isinstance(typ, typing._SpecialForm) and name is not None:
+        return (name.lower(), "special", None)
+    raise Exception("Could not get the name of type '" + str(typ) + "'")
+
+def get_type_info(typ):
+    """Get the name, the kind and the origin of a type. The result is memoized
+    per type object, so that asking for it several times costs a dictionary
+    lookup.
+    Parameters:
+        typ - type or type from the typing module:
+            The type to inspect
+    Returns:
+        tuple:
+            A tuple (name, kind, origin) where
+            - name is the simplest name of the type (e.g. typing.Union[str,
+              int] is reduced to "union", typing.List[int] to "list")
+            - kind is one of "any", "union", "generic" (a parametrized
+              collection such as List[int] or list[int]), "type" (a class),
+              "spec" (a TypeSpec) or "special" (another special form of the
+              typing module)
+            - origin is the unsubscripted type for generics and unions (e.g.
+              list for List[int]), and None otherwise
+    """
+    try:
+        return _type_info[typ]
+    except KeyError:
+        info = _type_info[typ] = _resolve_type_info(typ)
+        return info
+    except TypeError:
+        # Unhashable types (e.g. with unhashable arguments) cannot be memoized
+        return _resolve_type_info(typ)
 
 def is_generic(typ):
-    """Detect if the parameter is a generic alias from the typing module (e.g.
-    list, dict, tuple, set...)
+    """Detect if the parameter is a generic alias (e.g. List[int], dict[str,
+    int]...). Unions are not considered generic.
     Parameters:
         typ - type or type from the typing module:
             The type to detect
     Returns:
         bool:
-            Return True if 'typ' is a generic alias from the typing module, and
-            False otherwise
+            Return True if 'typ' is a generic alias, and False otherwise
     """
-    return isinstance(typ, typing._GenericAlias)
+    return get_type_info(typ)[1] == "generic"
 
 def get_name(typ):
     """Get the name of the type given. the name should be the simplest (e.g.
@@ -26,14 +162,19 @@ def get_name(typ):
         str:
             The name of the type
     """
-    if type(typ) is type:
-        return typ.__name__
-    else:
-        group = re.search(r"^typing.(\w+)(\[|$)", str(typ))
-        if group is not None:
-            return group[1].lower()
-        else:
-            raise Exception("Could not get the name of type '" + str(typ) + "'")
+    return get_type_info(typ)[0]
+
+def get_origin(typ):
+    """Get the type that a value of type 'typ' has (e.g. list for List[int]).
+    Parameters:
+        typ - type or type from the typing module:
+            The type to convert
+    Returns:
+        type:
+            The origin of 'typ' for generics and unions, 'typ' itself otherwise
+    """
+    origin = get_type_info(typ)[2]
+    return typ if origin is None else origin
 
 def get_surrounding(type_list, index):
     """Convert the neighbors into string. This is typically used to create a
@@ -56,7 +197,7 @@ def get_surrounding(type_list, index):
     left = ""
     for i in range(index):
         if is_generic(type_list[i]):
-            left += type_list[i].__origin__.__name__
+            left += get_origin(type_list[i]).__name__
             left += "[...]"
         else:
             left += get_name(type_list[i])
@@ -66,25 +207,1815 @@ def get_surrounding(type_list, index):
     for i in range(index+1, len(type_list)):
         right += ", "
         if is_generic(type_list[i]):
-            right += type_list[i].__origin__.__name__
+            right += get_origin(type_list[i]).__name__
             right += "[...]"
         else:
             right += get_name(type_list[i])
     return (left, right)
 
+class _Context:
+    """Position of a type in the type architecture. The surrounding of the
+    error messages (see error_msg) is only rendered from it when an error is
+    raised, the checkers only keep a reference to it.
+    Parameters:
+        parent - _Context or None:
+            The position of the type containing 'typ', None at the top level
+        typ - type or typing._GenericAlias:
+            The type containing the position (a generic, a union or a
+            TypeSpec)
+        index - int or None:
+            The position of the child among the arguments of 'typ' (e.g. 1 for
+            the int of Tuple[str, int]). If None, the position is the content
+            of 'typ' as a whole (e.g. the elements of a list)
+    """
+    __slots__ = ("parent", "typ", "index")
+
+    def __init__(self, parent, typ, index=None):
+        self.parent = parent
+        self.typ = typ
+        self.index = index
+
+    def render(self, left, right):
+        """Render the surrounding of the position, e.g. ("dict[str, ", "]")
+        for the values of Dict[str, int].
+        Parameters:
+            left - str:
+                The left surrounding of the parent position
+            right - str:
+                The right surrounding of the parent position
+        Returns:
+            tuple:
+                The left and right surrounding
+        """
+        name, kind, origin = get_type_info(self.typ)
+        left += name + "["
+        right = "]" + right
+        if self.index is not None:
+            args = typing.get_args(self.typ)
+            if origin is dict or origin in _mapping_origins:
+                # The key of a dict is named even if it is a generic
+                left += get_name(get_origin(args[0])) + ", "
+            else:
+                child_left, child_right = get_surrounding(args, self.index)
+                left += child_left
+                right = child_right + right
+        return (left, right)
+
+def render_context(context):
+    """Render the surrounding of a position in the type architecture.
+    Parameters:
+        context - _Context or None:
+            The position, None for the top level
+    Returns:
+        tuple:
+            The left and right surrounding
+    """
+    # The positions are rendered from the outermost one, without recursion
+    # as the classes referring to themselves can nest them deeply
+    contexts = []
+    while context is not None:
+        contexts.append(context)
+        context = context.parent
+    left, right = "", ""
+    for context in reversed(contexts):
+        left, right = context.render(left, right)
+    return (left, right)
+
+def _rebased(context, root, new_root):
+    """Move a position of the type architecture under another one.
+    Parameters:
+        context - _Context or None:
+            The position
+        root - _Context or None:
+            An ancestor of 'context' (or 'context' itself)
+        new_root - _Context or None:
+            The position replacing 'root'
+    Returns:
+        _Context or None:
+            The position, 'root' being replaced by 'new_root'
+    """
+    contexts = []
+    while context is not root and context is not None:
+        contexts.append(context)
+        context = context.parent
+    for context in reversed(contexts):
+        new_root = type(context)(new_root, context.typ, context.index)
+    return new_root
+
+class _FieldContext(_Context):
+    """Position of a field of a dataclass, a NamedTuple or a TypedDict (see
+    _field_plan), rendered with the name of the field, e.g. ("Point[y: ",
+    "]") for the field y of Point.
+    Parameters:
+        parent - _Context or None:
+            The position of the class in the type architecture
+        typ - type:
+            The class
+        index - str:
+            The name of the field
+    """
+    __slots__ = ()
+
+    def render(self, left, right):
+        return (left + get_name(self.typ) + "[" + self.index + ": ",
+                "]" + right)
+
+class _Mismatch(Exception):
+    """Raised by the compiled checkers when a value does not match the
+    expected type. It only carries references to the elements needed by
+    'error_msg', the message is built by the caller, who knows the function
+    name and the parameter position.
+    The containers add the position of the wrong child in 'path' while the
+    exception goes up, so that the path goes from the innermost position to
+    the outermost one.
+    Parameters:
+        expected - list[type or str]:
+            The list of expected types
+        actual - list[type or str]:
+            The list of actual types
+        context - _Context or None:
+            The position of the types in the type architecture
+    """
+    def __init__(self, expected, actual, context):
+        super().__init__(expected, actual, context)
+        self.path = []
+
+    def to_type_error(self, f_name, param_idx, index=None):
+        """Build the TypeError to raise. Its 'path' attribute gives the
+        position of the wrong value in the checked value, from the outermost
+        position to the innermost one (e.g. (2, "a") for the value at
+        arg[2]["a"]). For sets, the position is the element itself.
+        Parameters:
+            f_name - str:
+                The name of the function being type-checked
+            param_idx - int or str:
+                The parameter position (or name), -1 for the return value
+            index - int or None:
+                The position of the element for the values checked one
+                element at a time (see error_msg)
+        Returns:
+            TypeError:
+                The error
+        """
+        expected, actual, context = self.args
+        error = TypeError(error_msg(f_name, param_idx, expected, actual,
+                                    render_context(context), index))
+        error.path = tuple(reversed(self.path))
+        return error
+
+def _position(container, elem):
+    """Find the position of an element in a container, to locate an error.
+    Parameters:
+        container - list, tuple, set or dict:
+            The container (or a sequence, a set or a mapping)
+        elem - unknown:
+            The element (the value for a dict)
+    Returns:
+        unknown:
+            The index of the element for lists, tuples and sequences, the key
+            for dicts and mappings, the element itself otherwise
+    """
+    if isinstance(container, collections.abc.Mapping):
+        for key, value in container.items():
+            if value is elem:
+                return key
+    elif isinstance(container, collections.abc.Sequence):
+        for i, x in enumerate(container):
+            if x is elem:
+                return i
+    return elem
+
+def _fail_at(fail, container, elem):
+    """Run the checker 'fail' on an element known to be wrong, to raise the
+    error with the position of the element.
+    Parameters:
+        fail - function:
+            The checker of the element
+        container - list, tuple, set or dict:
+            The container of the element
+        elem - unknown:
+            The element
+    Returns:
+        None
+    """
+    try:
+        fail(elem)
+    except _Mismatch as e:
+        e.path.append(_position(container, elem))
+        raise
+
+# Available check levels (see set_check_level)
+_check_levels = ("off", "shallow", "full")
+# Check levels by module name, "" being the default. The generation changes
+# each time a level is set, so that the decorators know when to look again.
+_module_levels = {"": "full"}
+_level_generation = 0
+
+# Maximum number of elements checked in each container by the decorators that
+# do not specify it (see set_sample_size). None means all the elements.
+_sample_size = None
+
+# Validation cache of the immutable values already checked (see
+# set_cache_size), None when disabled. It maps (id(value), checker) to the
+# value itself, or to a weak reference to it when the value supports it.
+_cache = None
+_cache_size = None
+
+# Runtime statistics of the decorated functions, indexed by their qualified
+# name (see set_stats_enabled), None when disabled
+_stats = None
+
+# Parallel validation of the large containers (see set_parallel), None when
+# disabled
+_parallel = None
+
+# Reporter of the violations when they do not raise (see
+# set_violation_sink), None when the violations raise a TypeError
+_reporter = None
+
+# Origins of the types whose elements are checked lazily, as they are consumed
+# (see compile_wrapper)
+_lazy_origins = (collections.abc.Iterator,
+                 collections.abc.Iterable,
+                 collections.abc.Generator,
+                 collections.abc.AsyncIterator,
+                 collections.abc.AsyncIterable,
+                 collections.abc.AsyncGenerator)
+
+# Origins of the abstract containers whose elements all have the same
+# expected type, checked like lists and sets (e.g. Sequence[int])
+_collection_origins = (collections.abc.Sequence,
+                       collections.abc.MutableSequence,
+                       collections.abc.Set,
+                       collections.abc.MutableSet,
+                       collections.abc.Collection,
+                       collections.abc.KeysView,
+                       collections.abc.ValuesView)
+# Origins of the abstract mappings, checked like dicts (e.g. Mapping[str,
+# int])
+_mapping_origins = (collections.abc.Mapping,
+                    collections.abc.MutableMapping)
+
+# Decisions of _is_subtype, indexed by the (actual type, expected type) pair
+_subtypes = {}
+
+def _is_subtype(actual, expected):
+    """Check if a type is a subclass of the expected one, e.g. bool of int,
+    or list of Sequence. The checkers first compare the types by identity,
+    this is only called for the values whose type is not exactly the
+    expected one. The decision is cached per pair of types, as issubclass is
+    slow for the abstract base classes : a container of values of the same
+    subclass only computes it once.
+    Parameters:
+        actual - type:
+            The type of the value
+        expected - type or frozenset:
+            The expected type, or the set of the accepted types (see
+            _accepted_types)
+    Returns:
+        bool:
+            True if 'actual' is a subclass of 'expected' (or of one of the
+            accepted types)
+    """
+    key = (actual, expected)
+    try:
+        return _subtypes[key]
+    except KeyError:
+        pass
+    if isinstance(expected, frozenset):
+        decision = any(issubclass(actual, x) for x in expected)
+    else:
+        decision = issubclass(actual, expected)
+    _subtypes[key] = decision
+    return decision
+
+# Compiled checkers, indexed by the expected type (see compile_type). A type
+# annotation never changes, so there is no need to compile it more than once.
+_compiled = {}
+
+# Fields of the dataclasses, NamedTuples and TypedDicts, indexed by class
+# (see _field_plan)
+_field_plans = {}
+# Plans of the classes whose annotations could not be resolved yet, with the
+# number of names of their module at the time (see _field_plan)
+_unresolved_plans = {}
+
+def _field_plan(cls):
+    """Get the fields of a dataclass, a NamedTuple or a TypedDict, whose
+    values are checked field by field rather than by their type only. The
+    annotations of a class are resolved once, on its first check. The
+    annotations referring to names not defined yet (e.g. a class defined
+    further in the module) are resolved again once the module has new
+    names.
+    Parameters:
+        cls - type:
+            The class
+    Returns:
+        tuple or None:
+            A tuple (reader, fields), where reader is "index" for the
+            NamedTuples (their fields are read by position), "attribute" for
+            the dataclasses and "key" for the TypedDicts, and fields a tuple
+            of (name, position, type, required) for each field, or None if
+            the annotations cannot be resolved yet. None if 'cls' has no
+            fields to check.
+    """
+    try:
+        return _field_plans[cls]
+    except KeyError:
+        pass
+    plan = None
+    if isinstance(cls, type):
+        module = sys.modules.get(cls.__module__)
+        names_count = None if module is None else len(vars(module))
+        unresolved = _unresolved_plans.get(cls)
+        if unresolved is not None and unresolved[0] == names_count:
+            return unresolved[1]
+        if issubclass(cls, tuple) and hasattr(cls, "_fields"):
+            reader = "index"
+            names = [(x, j) for j, x in enumerate(cls._fields)]
+        elif dataclasses.is_dataclass(cls):
+            reader = "attribute"
+            names = [(x.name, x.name) for x in dataclasses.fields(cls)]
+        elif typing.is_typeddict(cls):
+            reader = "key"
+            names = [(x, x) for x in cls.__annotations__]
+        else:
+            names = None
+        try:
+            # The class can refer to itself (e.g. the next node of a list)
+            hints = typing.get_type_hints(cls, None, {cls.__name__: cls}) \
+                    if names else {}
+        except NameError:
+            # The fields are checked once the names are defined
+            plan = (reader, None)
+            _unresolved_plans[cls] = (names_count, plan)
+            return plan
+        _unresolved_plans.pop(cls, None)
+        fields = tuple((name, position, hints[name],
+                        name not in getattr(cls, "__optional_keys__", ()))
+                       for name, position in names or () if name in hints)
+        if fields:
+            plan = (reader, fields)
+    _field_plans[cls] = plan
+    return plan
+
+def _top_type(typ):
+    """Get the type that a value must have to match 'typ', without looking at
+    its children (this is the Layer 0 check of the type architecture).
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+    Returns:
+        type or None:
+            The type to compare with the type of the value, or None if any type
+            is accepted at this level (Any or Union) or if the type cannot be
+            checked by identity (Iterator, Iterable, Generator)
+    """
+    name, kind, origin = get_type_info(typ)
+    if kind == "any" or kind == "union" or origin in _lazy_origins:
+        return None
+    if kind == "generic" or kind == "spec":
+        return origin
+    if kind == "special":
+        raise NotImplementedError("The type " + str(typ)
+                                  + " is not supported yet")
+    if typ is None:
+        return type(None)
+    # isinstance raises a TypeError for the protocols that are not
+    # runtime_checkable
+    if getattr(typ, "_is_protocol", False) and \
+       not getattr(typ, "_is_runtime_protocol", False):
+        raise NotImplementedError("The protocol " + str(typ)
+                                  + " is not runtime_checkable")
+    # The values of a TypedDict are plain dicts
+    plan = _field_plan(typ)
+    if plan is not None and plan[0] == "key":
+        return dict
+    return typ
+
+def _compile_children(typ, context, sample=None):
+    """Build a checker for the children of a value whose own type has already
+    been checked against 'typ'. All the decisions depending only on the
+    expected type (which children need a deeper check, the position of the
+    children in the error messages...) are taken here once, so that the
+    checker returned only needs to look at the value.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type of the value
+        context - _Context or None:
+            The position of 'typ' in the type architecture
+        sample - int or None:
+            The maximum number of elements checked per container (see
+            _sampled), or None to check all of them
+    Returns:
+        function or None:
+            A function taking the value as single argument and raising a
+            _Mismatch if one of its children does not have the expected type,
+            or None if there is nothing to check below this level
+    """
+    # ---------------- union -------------------
+    # The value must be of one of the types of the union
+    name, kind, origin = get_type_info(typ)
+    if kind == "union":
+        return _compile_union(typ, context, sample)
+
+    if kind == "spec":
+        return typ.compile_children(context)
+
+    # ------------ dataclass, NamedTuple, TypedDict ------------
+    if kind == "type":
+        return _compile_fields(typ, context, sample)
+
+    # ------------- iterator/iterable -----------
+    # Only the type of the value is checked here, the elements are checked as
+    # they are consumed, by the proxy built by compile_wrapper
+    if origin in _lazy_origins:
+        def check_iterable(arg):
+            if not isinstance(arg, origin):
+                raise _Mismatch([name], [type(arg)], context)
+        return check_iterable
+
+    # Unparametrized generics (e.g. List) only need the Layer 0 check
+    args = typing.get_args(typ)
+    if kind != "generic" or len(args) == 0:
+        return None
+
+    new_context = _Context(context, typ)
+    # ---------------- tuple -------------------
+    # for tuple, each child has its own expected type
+    if origin is tuple:
+        subtypes = args
+        subtypes_expected = [get_origin(x) for x in subtypes]
+        length = len(subtypes)
+
+        def fail_tuple(arg):
+            raise _Mismatch(subtypes_expected,
+                            [type(x) for x in arg],
+                            new_context)
+
+        # The children whose type must be compared at this level
+        to_compare = _tuple_comparisons(subtypes)
+        # The children that need a deeper check
+        to_descend = []
+        for j in range(length):
+            child = _compile_children(subtypes[j],
+                                      _Context(context, typ, j),
+                                      sample)
+            if child is not None:
+                to_descend.append((j, child))
+        to_descend = tuple(to_descend)
+
+        def check_tuple(arg):
+            if len(arg) != length:
+                fail_tuple(arg)
+            for j, expected in to_compare:
+                if type(arg[j]) is not expected and \
+                   not _is_subtype(type(arg[j]), expected):
+                    fail_tuple(arg)
+            try:
+                for j, child in to_descend:
+                    child(arg[j])
+            except _Mismatch as e:
+                e.path.append(j)
+                raise
+        return check_tuple
+
+    # -------------- set or list ----------------
+    # for set, frozenset and list, all the children have the same expected
+    # type
+    if origin is list or origin is set or origin is frozenset or \
+       origin in _collection_origins:
+        return _sampled(_compile_elements(args[0], new_context, sample),
+                        sample,
+                        origin)
+
+    # ------------------ dict -------------------
+    # for dict, the children are key-value pairs, both must be checked
+    if origin is dict or origin in _mapping_origins:
+        return _sampled(_compile_dict(typ, new_context, context, sample),
+                        sample,
+                        dict if origin in _mapping_origins else origin)
+
+    raise NotImplementedError("The type " + str(typ)
+                              + " is not supported yet")
+
+# Marks the types matching none of the members of a union (see
+# _compile_union)
+_no_branch = object()
+
+def _compile_union(typ, context, sample):
+    """Build the checker of a union. The members are resolved once into a
+    table giving, for the type of a value, the checker of the members it
+    matches, so that checking a value costs a dictionary lookup whatever the
+    number of members. The types not in the table (e.g. subclasses) are
+    resolved on their first occurrence and added to it.
+    Parameters:
+        typ - typing._GenericAlias:
+            The union
+        context - _Context or None:
+            The position of the union in the type architecture
+        sample - int or None:
+            The maximum number of elements checked per container (see
+            _sampled), or None to check all of them
+    Returns:
+        function or None:
+            The checker of the value, or None if the union contains Any
+    """
+    new_context = _Context(context, typ)
+    subtypes = typing.get_args(typ)
+    subtypes_expected = [get_origin(x) for x in subtypes]
+    if Any in subtypes_expected:
+        return None
+    # The type a value must have to match each member, and the checker of
+    # its children. The types checked by the member itself (e.g. Buffer)
+    # match any value
+    members = []
+    for j in range(len(subtypes)):
+        expected = _top_type(subtypes[j])
+        if expected is None:
+            _, _, origin = get_type_info(subtypes[j])
+            expected = object if origin is None else origin
+        members.append((expected,
+                        _compile_children(subtypes[j],
+                                          _Context(context, typ, j),
+                                          sample)))
+
+    def resolve(actual):
+        # The members matched by the type, in order
+        branches = [child for expected, child in members
+                    if actual is expected or _is_subtype(actual, expected)]
+        if not branches:
+            branch = _no_branch
+        elif None in branches:
+            # A member without children accepts the value right away
+            branch = None
+        elif len(branches) == 1:
+            branch = branches[0]
+        else:
+            # Several members with the same type (e.g. Union[List[int],
+            # List[str]]), the value must match one of them
+            def branch(arg):
+                error = None
+                # The values deferred by a member that does not match are
+                # not checked (see _compile_fields)
+                stack = getattr(_deferred, "stack", None)
+                base = 0 if stack is None else len(stack)
+                for child in branches:
+                    try:
+                        child(arg)
+                        return
+                    except _Mismatch as e:
+                        if type(e) is _Found:
+                            raise
+                        if stack is not None:
+                            del stack[base:]
+                        if error is None:
+                            error = e
+                raise error
+        table[actual] = branch
+        return branch
+
+    table = {}
+    for expected, child in members:
+        if expected not in table:
+            resolve(expected)
+
+    def check_union(arg):
+        try:
+            branch = table[type(arg)]
+        except KeyError:
+            branch = resolve(type(arg))
+        if branch is None:
+            return
+        if branch is _no_branch:
+            raise _Mismatch(subtypes_expected,
+                            [type(arg)],
+                            new_context)
+        branch(arg)
+    return check_union
+
+def _compile_elements(subtype, new_context, sample):
+    """Build the checker of the elements of a list, a set or a frozenset,
+    which all have the same expected type.
+    Parameters:
+        subtype - type or typing._GenericAlias:
+            The expected type of the elements
+        new_context - _Context:
+            The position of the elements in the type architecture
+        sample - int or None:
+            The maximum number of elements checked per container (see
+            _sampled), or None to check all of them
+    Returns:
+        function or None:
+            The checker of the elements, or None if there is nothing to check
+    """
+    accepted = _accepted_types(subtype)
+    expected = _top_type(subtype)
+    child = _compile_children(subtype, new_context, sample)
+    # Raise the error for an element that is not accepted
+    fail = _compile_checker(subtype, new_context, sample)
+
+    # The decision is taken once here, the checkers below only contain
+    # the loop over the elements
+    tuple_comparisons = None
+    if expected is tuple and child is not None:
+        subtypes = typing.get_args(subtype)
+        if all(_accepted_types(x) is not None and
+               len(_accepted_types(x)) == 1 for x in subtypes):
+            tuple_comparisons = _tuple_comparisons(subtypes)
+    if tuple_comparisons is not None:
+        # Tuples of plain types (e.g. List[Tuple[str, int]]) are checked
+        # in the loop itself, without a call per element
+        length = len(tuple_comparisons)
+
+        def check_plain_tuple_elements(arg):
+            for elem in arg:
+                if type(elem) is not tuple or len(elem) != length:
+                    _fail_at(fail, arg, elem)
+                for j, expected in tuple_comparisons:
+                    if type(elem[j]) is not expected:
+                        _fail_at(fail, arg, elem)
+        return check_plain_tuple_elements
+    if accepted is not None and len(accepted) == 1:
+        (expected,) = accepted
+
+        def check_plain_elements(arg):
+            for elem in arg:
+                if type(elem) is not expected:
+                    _fail_at(fail, arg, elem)
+        return check_plain_elements
+    if accepted is not None:
+        def check_union_elements(arg):
+            for elem in arg:
+                if type(elem) not in accepted:
+                    _fail_at(fail, arg, elem)
+        return check_union_elements
+    if expected is None:
+        if child is None:
+            return None
+
+        def check_children(arg):
+            try:
+                for elem in arg:
+                    child(elem)
+            except _Mismatch as e:
+                e.path.append(_position(arg, elem))
+                raise
+        return check_children
+
+    # Each element is fully checked before the next one, so that the first
+    # wrong element stops the check and no state is kept between elements
+    def check_elements(arg):
+        for elem in arg:
+            if type(elem) is not expected:
+                # The full checker accepts the subclasses, and checks their
+                # children
+                _fail_at(fail, arg, elem)
+                continue
+            try:
+                child(elem)
+            except _Mismatch as e:
+                e.path.append(_position(arg, elem))
+                raise
+    return check_elements
+
+def _compile_dict(typ, new_context, context, sample):
+    """Build the checker of the key-value pairs of a dict.
+    Parameters:
+        typ - typing._GenericAlias:
+            The expected type of the dict
+        new_context - _Context:
+            The position of the key-value pairs in the type architecture
+        context - _Context or None:
+            The position of the dict in the type architecture
+        sample - int or None:
+            The maximum number of pairs checked per dict (see _sampled), or
+            None to check all of them
+    Returns:
+        function or None:
+            The checker of the key-value pairs, or None if there is nothing to
+            check
+    """
+    # If the dict has no expected key-value types, the arguments are type
+    # variables (~KT, ~VT)
+    args = typing.get_args(typ)
+    if isinstance(args[0], typing.TypeVar):
+        return None
+    key_type, value_type = args
+    key_expected = _top_type(key_type)
+    value_expected = _top_type(value_type)
+    types_expected = [get_origin(key_type), get_origin(value_type)]
+    value_child = _compile_children(value_type,
+                                    _Context(context, typ, 1),
+                                    sample)
+    # Checks the values whose type is a subclass of the expected one
+    value_checker = _compile_checker(value_type,
+                                     _Context(context, typ, 1),
+                                     sample)
+
+    def fail_pair(key, value):
+        try:
+            if (key_expected is not None and
+                type(key) is not key_expected and
+                not _is_subtype(type(key), key_expected)) or \
+               (value_expected is not None and
+                type(value) is not value_expected and
+                not _is_subtype(type(value), value_expected)):
+                raise _Mismatch(types_expected,
+                                [type(key), type(value)],
+                                new_context)
+            # The types may only be subclasses of the expected ones
+            value_checker(value)
+        except _Mismatch as e:
+            e.path.append(key)
+            raise
+
+    # Types accepted for the keys and values without further check. Only
+    # the keys of the key-value pairs are checked (unions of keys are not
+    # checked at all)
+    keys_accepted = None if key_expected is None else {key_expected}
+    values_accepted = _accepted_types(value_type)
+    if value_expected is None and value_child is None:
+        values_accepted = None
+
+    if keys_accepted is not None and values_accepted is not None and \
+       len(values_accepted) == 1:
+        (values_expected,) = values_accepted
+
+        def check_plain_dict(arg):
+            for key, value in arg.items():
+                if type(key) is not key_expected or \
+                   type(value) is not values_expected:
+                    fail_pair(key, value)
+        return check_plain_dict
+    if keys_accepted is not None and values_accepted is not None:
+        def check_union_dict(arg):
+            for key, value in arg.items():
+                if type(key) is not key_expected or \
+                   type(value) not in values_accepted:
+                    fail_pair(key, value)
+        return check_union_dict
+    if values_accepted is not None:
+        def check_values(arg):
+            for value in arg.values():
+                if type(value) not in values_accepted:
+                    fail_pair(_position(arg, value), value)
+        return check_values
+    if key_expected is None and value_expected is None and \
+       value_child is None:
+        return None
+
+    if value_child is None:
+        def check_pairs(arg):
+            for key, value in arg.items():
+                if (key_expected is not None and
+                    type(key) is not key_expected) or \
+                   (value_expected is not None and
+                    type(value) is not value_expected):
+                    fail_pair(key, value)
+        return check_pairs
+
+    # Each pair is fully checked before the next one (see _compile_elements)
+    def check_dict(arg):
+        for key, value in arg.items():
+            if (key_expected is not None and
+                type(key) is not key_expected) or \
+               (value_expected is not None and
+                type(value) is not value_expected):
+                fail_pair(key, value)
+                continue
+            try:
+                value_child(value)
+            except _Mismatch as e:
+                e.path.append(key)
+                raise
+    return check_dict
+
+def _sampled(checker, sample, origin):
+    """Restrict a container checker to a subset of the elements when the
+    container is larger than 'sample'. The subset is deterministic, so that
+    the same value always leads to the same result. In sequences, the
+    elements are taken at regular intervals over the whole container (lists
+    are sliced, the other sequences walked at C speed with itertools.islice).
+    Sets and dicts cannot be indexed : walking them to the end would cost a
+    full scan, so their first 'sample' elements are taken instead, and the
+    errors keep being located by the element (or the key).
+    Parameters:
+        checker - function or None:
+            The checker of the elements of the container
+        sample - int or None:
+            The maximum number of elements to check, or None to check all of
+            them
+        origin - type:
+            The type of the container (list, set or dict, or an abstract
+            collection)
+    Returns:
+        function or None:
+            The checker restricted to the sampled elements
+    """
+    if checker is None or sample is None:
+        return checker
+
+    def check_sample(arg):
+        if len(arg) <= sample:
+            return checker(arg)
+        if origin is dict:
+            return checker(dict(itertools.islice(arg.items(), sample)))
+        if not isinstance(arg, collections.abc.Sequence):
+            picked = list(itertools.islice(arg, sample))
+            try:
+                checker(picked)
+            except _Mismatch as e:
+                # The errors in a set are located by the element itself, not
+                # by its index in the sample
+                if e.path:
+                    e.path[-1] = picked[e.path[-1]]
+                raise
+            return
+        step = -(-len(arg) // sample)
+        try:
+            checker(arg[::step] if type(arg) is list else
+                    list(itertools.islice(arg, 0, None, step)))
+        except _Mismatch as e:
+            # The position found in a sliced list is an index of the slice
+            if e.path:
+                e.path[-1] *= step
+            raise
+    return check_sample
+
+# Classes whose fields are being compiled, with the checker of their fields
+# and their position in the type architecture, filled once compiled (see
+# _compile_fields)
+_compiling_fields = {}
+# Values of the classes referring to themselves waiting for the check of
+# their fields, in each thread (see _compile_fields)
+_deferred = threading.local()
+
+class _Found(_Mismatch):
+    """Raised when the value looked for by _deferred_path is reached, to
+    collect its path like an error does.
+    """
+
+def _deferred_path(entry, value):
+    """Find the position of a value whose check was deferred in the value
+    that deferred it (see _compile_fields), by checking the latter again.
+    Parameters:
+        entry - tuple:
+            The entry of the value that deferred the check
+        value - unknown:
+            The value
+    Returns:
+        list:
+            The path of the value, from the innermost position
+    """
+    _deferred.target = value
+    try:
+        entry[3][0](entry[0])
+    except _Found as e:
+        return e.path
+    finally:
+        _deferred.target = None
+    return []
+
+def _compile_fields(cls, context, sample):
+    """Build the checker of the fields of a dataclass, a NamedTuple or a
+    TypedDict (see _field_plan). The fields are read in a single pass, by
+    position, attribute or key, without looking at the __dict__ of the
+    value.
+    The values of a field referring back to the class (e.g. the next node
+    of a linked list) are not checked right away : they are added to a
+    list drained by the checker of the class, so that the depth of the
+    values does not grow the Python stack. Their position is only searched
+    for when one of them is wrong.
+    Parameters:
+        cls - type:
+            The class
+        context - _Context or None:
+            The position of the class in the type architecture
+        sample - int or None:
+            The maximum number of elements checked per container (see
+            _sampled), or None to check all of them
+    Returns:
+        function or None:
+            The checker of the fields, or None if 'cls' has no fields to
+            check
+    """
+    plan = _field_plan(cls)
+    if plan is None:
+        return None
+    if plan[1] is None:
+        # The annotations are resolved again on the next checks, the fields
+        # being compiled once they are
+        checker = None
+
+        def check_unresolved(arg):
+            nonlocal checker
+            if checker is None:
+                plan = _field_plan(cls)
+                if plan is not None and plan[1] is None:
+                    return
+                checker = _compile_fields(cls, context, sample) or \
+                          (lambda arg: None)
+            checker(arg)
+        return check_unresolved
+    if cls in _compiling_fields:
+        # A field refers back to the class : the value is checked by the
+        # checker of the class being compiled
+        owner = _compiling_fields[cls]
+        owner[2] = True
+
+        def check_recursive(arg):
+            target = getattr(_deferred, "target", None)
+            if target is not None:
+                # Looking for the position of a deferred value
+                if arg is target:
+                    raise _Found([], [], None)
+                return
+            _deferred.stack.append((arg, _deferred.entry, context, owner))
+        return check_recursive
+    reader, fields = plan
+    getter = operator.attrgetter if reader == "attribute" else \
+             operator.itemgetter
+    # The checker of the fields, their position, and whether they refer
+    # back to the class
+    owner = [None, context, False]
+    _compiling_fields[cls] = owner
+    try:
+        checkers = []
+        for name, position, typ, required in fields:
+            field_context = _FieldContext(context, cls, name)
+            checkers.append((position, getter(position), required, typ,
+                             field_context,
+                             _compile_checker(typ, field_context, sample)))
+        checkers = tuple(checkers)
+    finally:
+        del _compiling_fields[cls]
+
+    def check_fields(arg):
+        for position, get, required, typ, field_context, checker in checkers:
+            try:
+                value = get(arg)
+            except (KeyError, AttributeError):
+                # A key of a TypedDict, or a field of a dataclass never set
+                if not required:
+                    continue
+                e = _Mismatch([typ], ["missing"], field_context)
+                e.path.append(position)
+                raise e from None
+            try:
+                checker(value)
+            except _Mismatch as e:
+                e.path.append(position)
+                raise
+    owner[0] = check_fields
+    if not owner[2]:
+        return check_fields
+
+    def check_deferred(arg):
+        stack = getattr(_deferred, "stack", None)
+        if stack is None:
+            stack = _deferred.stack = []
+        # The values deferred by an enclosing check are left to it
+        base = len(stack)
+        parent = getattr(_deferred, "entry", None)
+        # The value, the entry of the value that deferred it, the position
+        # of the field and the class whose fields are checked
+        entry = (arg, None, None, owner)
+        try:
+            while True:
+                _deferred.entry = entry
+                start = len(stack)
+                try:
+                    entry[3][0](entry[0])
+                except _Mismatch as e:
+                    if type(e) is _Found:
+                        raise
+                    # Locate the value in the values that deferred it
+                    value, previous, field_context, value_owner = entry
+                    while previous is not None:
+                        e.path.extend(_deferred_path(previous, value))
+                        expected, actual, error_context = e.args
+                        e.args = (expected, actual,
+                                  _rebased(error_context, value_owner[1],
+                                           field_context))
+                        value, previous, field_context, value_owner = \
+                            previous
+                    raise
+                # The values are checked in the order of the fields
+                stack[start:] = reversed(stack[start:])
+                if len(stack) == base:
+                    return
+                entry = stack.pop()
+        finally:
+            del stack[base:]
+            _deferred.entry = parent
+    return check_deferred
+
+def _tuple_comparisons(subtypes):
+    """Get the children of a tuple whose type must be compared with the
+    expected one at the tuple level, with their position.
+    Parameters:
+        subtypes - tuple:
+            The expected types of the children of the tuple
+    Returns:
+        tuple:
+            A tuple of (position, type) pairs
+    """
+    return tuple((j, _top_type(subtypes[j]))
+                 for j in range(len(subtypes))
+                 if _top_type(subtypes[j]) is not None)
+
+def _accepted_types(typ):
+    """Get the set of types a value can have to fully match 'typ' without any
+    deeper check (e.g. {int} for int, {int, str} for Union[int, str]). This
+    allows containers to check their elements with a single membership test.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+    Returns:
+        frozenset or None:
+            The accepted types, or None if checking the type of the value is
+            not enough (or not needed, for Any)
+    """
+    name, kind, origin = get_type_info(typ)
+    if kind == "type" and _field_plan(typ) is None:
+        return frozenset([type(None) if typ is None else typ])
+    if kind == "generic" and len(typing.get_args(typ)) == 0 and \
+       origin not in _lazy_origins:
+        return frozenset([origin])
+    if kind == "union":
+        # The members with children need the checker of the union
+        accepted = [_accepted_types(x) for x in typing.get_args(typ)]
+        if None in accepted:
+            return None
+        return frozenset().union(*accepted)
+    return None
+
+def _compile_checker(typ, context, sample=None):
+    """Build the full checker of a value against 'typ' : the check of its own
+    type followed by the check of its children.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+        context - _Context or None:
+            The position of 'typ' in the type architecture, None at the top
+            level
+        sample - int or None:
+            The maximum number of elements checked per container (see
+            _sampled), or None to check all of them
+    Returns:
+        function:
+            A function taking a value as single argument and raising a
+            _Mismatch if the value does not match 'typ'
+    """
+    expected = _top_type(typ)
+    children = _compile_children(typ, context, sample)
+    # The types of the elements of the checked containers accepted without
+    # looking at their elements (see typechecker.containers). The elements
+    # are only checked when they are added : those that can be mutated in
+    # place afterwards (e.g. the lists of a CheckedList[List[int]]) must be
+    # checked again.
+    element_types = typing.get_args(typ)
+    if not all(_is_immutable_type(x) for x in element_types):
+        element_types = ()
+    if expected is None and children is None:
+        def checker(arg):
+            pass
+    elif expected is None:
+        checker = children
+    elif children is not None and element_types and \
+         (issubclass(expected, (list, set, dict)) or
+          expected in _collection_origins or
+          expected in _mapping_origins):
+        def checker(arg):
+            if type(arg) is not expected:
+                if not _is_subtype(type(arg), expected):
+                    raise _Mismatch([expected], [type(arg)], context)
+                # The elements of a checked container were checked when
+                # they were added
+                if getattr(type(arg), "_checked_types", None) == \
+                   element_types:
+                    return
+            children(arg)
+    elif children is None:
+        def checker(arg):
+            if type(arg) is not expected and \
+               not _is_subtype(type(arg), expected):
+                raise _Mismatch([expected], [type(arg)], context)
+    else:
+        def checker(arg):
+            if type(arg) is not expected and \
+               not _is_subtype(type(arg), expected):
+                raise _Mismatch([expected], [type(arg)], context)
+            children(arg)
+    return checker
+
+def compile_type(typ, sample=None, shallow=False):
+    """Compile the expected type 'typ' into a checker function. The type
+    architecture is walked only once, here, and turned into a tree of
+    specialized checkers. Running the checker on a value then only compares
+    types, without any introspection of the typing module.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+        sample - int or None:
+            The maximum number of elements checked in each list, set or dict
+            (see _sampled), or None to check all of them
+        shallow - bool:
+            If True, only the type of the value itself is checked, not its
+            children (this is the Layer 0 check of the type architecture)
+    Returns:
+        function:
+            A function taking a value as single argument and raising a
+            _Mismatch if the value does not match 'typ'
+    """
+    # Unions are equal whatever the order of their members, but the order
+    # matters in the error messages, hence the repr in the key
+    _check_sample(sample)
+    key = (typ, repr(typ), sample, shallow)
+    try:
+        return _compiled[key]
+    except KeyError:
+        pass
+    if shallow:
+        checker = _compile_shallow_checker(typ)
+    else:
+        checker = _compile_checker(typ, None, sample)
+        origin = get_origin(typ)
+        if sample is None and origin in _parallel_origins and \
+           len(typing.get_args(typ)) > 0:
+            checker = _parallelized(typ, checker, origin)
+        if get_origin(typ) in (tuple, frozenset) and _is_immutable_type(typ):
+            checker = _cached(checker)
+    _compiled[key] = checker
+    return checker
+
+def _compile_shallow_checker(typ):
+    """Build a checker of the type of a value, without looking at its
+    children.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+    Returns:
+        function:
+            A function taking a value as single argument and raising a
+            _Mismatch if the type of the value does not match 'typ'
+    """
+    expected = _top_type(typ)
+    if expected is None:
+        def checker(arg):
+            pass
+    else:
+        def checker(arg):
+            if type(arg) is not expected and \
+               not _is_subtype(type(arg), expected):
+                raise _Mismatch([expected], [type(arg)], None)
+    return checker
+
+# Origins of the containers whose elements can be checked in parallel (see
+# set_parallel)
+_parallel_origins = (list, set, frozenset, dict)
+
+def _parallelized(typ, checker, origin):
+    """Wrap the checker of a container so that the large containers are
+    checked in parallel when it is enabled (see set_parallel). Only the
+    top-level container is split, the checks of its elements are not.
+    Parameters:
+        typ - typing._GenericAlias:
+            The expected type of the container
+        checker - function:
+            The checker of the container
+        origin - type:
+            The type of the container (list, set, frozenset or dict)
+    Returns:
+        function:
+            The checker, checking the large containers in parallel
+    """
+    def check_parallel(arg):
+        parallel = _parallel
+        if parallel is None or type(arg) is not origin or \
+           len(arg) < parallel.threshold:
+            return checker(arg)
+        parallel.check(typ, checker, origin, arg)
+    return check_parallel
+
+def _check_chunk(checker, chunk):
+    """Check a chunk of a container in a worker (see set_parallel).
+    Parameters:
+        checker - function:
+            The checker of the container
+        chunk - list, set, frozenset or dict:
+            The chunk, of the same type as the container
+    Returns:
+        _Mismatch or None:
+            The mismatch found, or None if the chunk matches
+    """
+    try:
+        checker(chunk)
+    except _Mismatch as e:
+        return e
+    return None
+
+# Checkers compiled by the worker processes, indexed like _compiled
+_process_checkers = {}
+
+def _check_chunk_in_process(typ, chunk):
+    """Check a chunk of a container in a worker process, where the checker is
+    compiled again since it cannot be pickled (see set_parallel).
+    Parameters:
+        typ - typing._GenericAlias:
+            The expected type of the container
+        chunk - list, set, frozenset or dict:
+            The chunk, of the same type as the container
+    Returns:
+        _Mismatch or None:
+            The mismatch found, or None if the chunk matches
+    """
+    key = (typ, repr(typ))
+    checker = _process_checkers.get(key)
+    if checker is None:
+        # compile_type would check the chunk in parallel again
+        checker = _process_checkers[key] = _compile_checker(typ, None)
+    return _check_chunk(checker, chunk)
+
+def _is_free_threaded():
+    """Detect if the interpreter runs without the global interpreter lock,
+    in which case the threads check the chunks at the same time.
+    Returns:
+        bool:
+            True for a free-threaded build with the GIL disabled
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+class _Parallel:
+    """Check the large containers by splitting them into chunks checked by a
+    pool of workers (see set_parallel).
+    Parameters:
+        threshold - int:
+            The minimum number of elements of a container checked in
+            parallel
+        workers - int or None:
+            The number of workers, None for the number of processors
+        kind - str:
+            "thread" or "process"
+    """
+    # Number of chunks per worker, so that a slow chunk does not keep the
+    # other workers waiting
+    chunks_per_worker = 4
+
+    def __init__(self, threshold, workers, kind):
+        self.threshold = threshold
+        self.kind = kind
+        if kind == "thread":
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        else:
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        self.workers = self.executor._max_workers
+
+    def check(self, typ, checker, origin, arg):
+        """Check a container in parallel. The chunks are waited for in order,
+        so that the error raised is the one of the first wrong element, as
+        with a sequential check. The chunks not started yet are cancelled
+        once an error is found.
+        Parameters:
+            typ - typing._GenericAlias:
+                The expected type of the container
+            checker - function:
+                The checker of the container
+            origin - type:
+                The type of the container
+            arg - list, set, frozenset or dict:
+                The container
+        Returns:
+            None
+        """
+        length = len(arg)
+        size = -(-length // (self.workers * self.chunks_per_worker))
+        starts = range(0, length, size)
+        if origin is list:
+            chunks = [arg[start:start + size] for start in starts]
+        else:
+            elements = iter(arg.items() if origin is dict else arg)
+            chunks = [origin(itertools.islice(elements, size))
+                      for start in starts]
+        if self.kind == "thread":
+            futures = [self.executor.submit(_check_chunk, checker, chunk)
+                       for chunk in chunks]
+        else:
+            futures = [self.executor.submit(_check_chunk_in_process, typ,
+                                            chunk)
+                       for chunk in chunks]
+        try:
+            for start, future in zip(starts, futures):
+                error = future.result()
+                if error is not None:
+                    # The position found in a chunk of a list is an index of
+                    # the chunk
+                    if origin is list and error.path:
+                        error.path[-1] += start
+                    raise error
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # The values that cannot be pickled are checked sequentially
+            checker(arg)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        """Stop the workers, without waiting for the chunks being checked.
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def set_parallel(threshold, workers=None, kind="auto"):
+    """Check the lists, sets and dicts of at least 'threshold' elements in
+    parallel, by splitting them into chunks checked by a pool of workers.
+    Only the containers given as argument or returned are split, not the
+    containers inside them. The error raised is the same as with a
+    sequential check.
+    Threads only check the chunks at the same time on a free-threaded
+    build of CPython. Processes work on any build, but the chunks are
+    pickled to be sent to the workers, the values that cannot be pickled
+    being checked sequentially : they only pay off when checking an element
+    costs more than pickling it, which is rarely the case for plain types.
+    Parameters:
+        threshold - int or None:
+            The minimum number of elements of a container checked in
+            parallel, or None to disable the parallel checks (default)
+        workers - int or None:
+            The number of workers, None for the number of processors
+        kind - str:
+            "thread", "process", or "auto" for threads on a free-threaded
+            build and sequential checks otherwise
+    Returns:
+        None
+    """
+    global _parallel
+    if threshold is not None and (type(threshold) is not int or
+                                  threshold < 1):
+        raise ValueError("The threshold must be a positive int or None, got "
+                         + repr(threshold))
+    if kind not in ("auto", "thread", "process"):
+        raise ValueError("Unknown kind of workers '" + str(kind)
+                         + "', expected one of auto, thread, process")
+    if kind == "auto":
+        # Pickling the chunks for processes costs more than checking them
+        # in most cases, the processes must be asked for explicitly
+        if not _is_free_threaded():
+            threshold = None
+        kind = "thread"
+    previous = _parallel
+    _parallel = None if threshold is None else \
+                _Parallel(threshold, workers, kind)
+    if previous is not None:
+        previous.shutdown()
+
+def get_parallel():
+    """Get the setting of the parallel checks (see set_parallel).
+    Returns:
+        tuple or None:
+            The threshold, the number of workers and the kind of workers
+            ("thread" or "process"), or None if the parallel checks are
+            disabled
+    """
+    if _parallel is None:
+        return None
+    return (_parallel.threshold, _parallel.workers, _parallel.kind)
+
+def _is_immutable_type(typ):
+    """Detect if a value matching 'typ' cannot stop matching it afterwards,
+    i.e. if the check never looks inside a mutable container.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+    Returns:
+        bool:
+            True if a value that matched 'typ' always matches it
+    """
+    name, kind, origin = get_type_info(typ)
+    args = typing.get_args(typ)
+    if kind == "union":
+        return all(_is_immutable_type(x) for x in args)
+    if kind == "spec" or origin in _lazy_origins:
+        return False
+    # The fields of a class can be reassigned
+    if kind == "type" and _field_plan(typ) is not None:
+        return False
+    if kind != "generic" or len(args) == 0:
+        return True
+    if origin is tuple or origin is frozenset:
+        return all(_is_immutable_type(x) for x in args)
+    return False
+
+def _cached(checker):
+    """Wrap the checker of an immutable type with the validation cache (see
+    set_cache_size), so that checking again a value that is still alive costs
+    a dictionary lookup.
+    Parameters:
+        checker - function:
+            The checker of a type for which _is_immutable_type is True
+    Returns:
+        function:
+            The checker using the cache when it is enabled
+    """
+    def check_cached(arg):
+        cache = _cache
+        if cache is None:
+            return checker(arg)
+        key = (id(arg), checker)
+        entry = cache.get(key)
+        # The id of a dead value can be reused, hence the identity check
+        if entry is not None and \
+           (entry is arg or (type(entry) is weakref.ref and entry() is arg)):
+            cache.move_to_end(key)
+            return
+        checker(arg)
+        try:
+            entry = weakref.ref(arg, lambda ref: cache.pop(key, None))
+        except TypeError:
+            # tuples cannot be weakly referenced, the value is kept alive
+            # until it leaves the cache
+            entry = arg
+        cache[key] = entry
+        if len(cache) > _cache_size:
+            cache.popitem(last=False)
+    return check_cached
+
+def compile_wrapper(typ, sample=None):
+    """Compile the part of the check of 'typ' that cannot be done right away :
+    the elements of an Iterator, an Iterable or a Generator (or of their async
+    counterparts) are only known when they are consumed. The value is then
+    wrapped in a proxy checking each element as it goes through, without
+    buffering anything.
+    Only the top-level type can be wrapped, an iterator nested in a container
+    is only checked to be an iterator.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+        sample - int or None:
+            The maximum number of elements checked in each list, set or dict
+            found in the elements
+    Returns:
+        function or None:
+            A function taking the value, the function name, the parameter
+            position and optionally the qualified name of the function (see
+            _stats_key), and returning the proxy, or None if 'typ' does not
+            need a proxy
+    """
+    name, kind, origin = get_type_info(typ)
+    args = typing.get_args(typ)
+    if origin not in _lazy_origins or len(args) == 0:
+        return None
+    checker = _compile_checker(args[0], _Context(None, typ, 0), sample)
+    # An async generator keeps asend, athrow and aclose whatever the type it
+    # is declared with, the wrapper of an async generator function uses them
+    if origin is collections.abc.AsyncGenerator:
+        def wrap_async_generator(arg, f_name, param_idx, function=None):
+            return _CheckedAsyncGenerator(arg, checker, f_name, param_idx,
+                                          function)
+        return wrap_async_generator
+    if origin is collections.abc.AsyncIterator:
+        def wrap_async_iterator(arg, f_name, param_idx, function=None):
+            if inspect.isasyncgen(arg):
+                return _CheckedAsyncGenerator(arg, checker, f_name,
+                                              param_idx, function)
+            return _CheckedAsyncIterator(arg, checker, f_name, param_idx,
+                                         function)
+        return wrap_async_iterator
+    if origin is collections.abc.AsyncIterable:
+        def wrap_async_iterable(arg, f_name, param_idx, function=None):
+            if inspect.isasyncgen(arg):
+                return _CheckedAsyncGenerator(arg, checker, f_name,
+                                              param_idx, function)
+            return _CheckedAsyncIterable(arg, checker, f_name, param_idx,
+                                         function)
+        return wrap_async_iterable
+    if origin is collections.abc.Generator:
+        return_checker = _compile_checker(args[2], _Context(None, typ, 2),
+                                          sample)
+
+        def wrap_generator(arg, f_name, param_idx, function=None):
+            return _CheckedGenerator(arg, checker, return_checker,
+                                     f_name, param_idx, function)
+        return wrap_generator
+    if origin is collections.abc.Iterator:
+        def wrap_iterator(arg, f_name, param_idx, function=None):
+            return _CheckedIterator(arg, checker, f_name, param_idx, function)
+        return wrap_iterator
+
+    def wrap_iterable(arg, f_name, param_idx, function=None):
+        return _CheckedIterable(arg, checker, f_name, param_idx, function)
+    return wrap_iterable
+
+def _no_check(arg):
+    """Checker accepting any value, replacing the checker of an iterator once
+    a violation has been reported (see set_violation_sink).
+    Parameters:
+        arg - unknown:
+            The value
+    Returns:
+        None
+    """
+
+class _CheckedElements:
+    """Base of the proxies checking the type of each element of an iterator,
+    synchronous or async.
+    Parameters:
+        iterator - iterator or async iterator:
+            The iterator to wrap
+        checker - function:
+            The checker of the elements
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __init__(self, iterator, checker, f_name, param_idx, function=None):
+        self._iterator = iterator
+        self._checker = checker
+        self._f_name = f_name
+        self._param_idx = param_idx
+        self._function = function
+        self._index = 0
+
+    def _check(self, elem):
+        index = self._index
+        self._index = index + 1
+        try:
+            self._checker(elem)
+        except _Mismatch as e:
+            error = e.to_type_error(self._f_name, self._param_idx,
+                                    index=index)
+            if _reporter is None:
+                raise error from None
+            # Only the first violation is reported
+            _reporter.report(error, self._function)
+            self._checker = _no_check
+        return elem
+
+class _CheckedIterator(_CheckedElements):
+    """Proxy of an iterator checking the type of each element it returns.
+    Parameters:
+        iterator - iterator:
+            The iterator to wrap
+        checker - function:
+            The checker of the elements
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._check(next(self._iterator))
+
+class _CheckedGenerator(_CheckedIterator):
+    """Proxy of a generator checking the type of each yielded value and of the
+    returned value.
+    Parameters:
+        generator - generator:
+            The generator to wrap
+        checker - function:
+            The checker of the yielded values
+        return_checker - function:
+            The checker of the returned value
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __init__(self, generator, checker, return_checker, f_name, param_idx,
+                 function=None):
+        super().__init__(generator, checker, f_name, param_idx, function)
+        self._return_checker = return_checker
+
+    def __next__(self):
+        return self.send(None)
+
+    def send(self, value):
+        try:
+            elem = self._iterator.send(value)
+        except StopIteration as e:
+            self._check_return(e.value)
+            raise
+        return self._check(elem)
+
+    def throw(self, *args):
+        try:
+            elem = self._iterator.throw(*args)
+        except StopIteration as e:
+            self._check_return(e.value)
+            raise
+        return self._check(elem)
+
+    def close(self):
+        self._iterator.close()
+
+    def _check_return(self, value):
+        try:
+            self._return_checker(value)
+        except _Mismatch as e:
+            error = e.to_type_error(self._f_name, self._param_idx)
+            if _reporter is None:
+                raise error from None
+            _reporter.report(error, self._function)
+
+class _CheckedAsyncIterator(_CheckedElements):
+    """Proxy of an async iterator checking the type of each element it
+    returns. The elements are awaited directly, without any task.
+    Parameters:
+        iterator - async iterator:
+            The async iterator to wrap
+        checker - function:
+            The checker of the elements
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return self._check(await self._iterator.__anext__())
+
+class _CheckedAsyncGenerator(_CheckedAsyncIterator):
+    """Proxy of an async generator checking the type of each yielded value.
+    Parameters:
+        generator - async generator:
+            The async generator to wrap
+        checker - function:
+            The checker of the yielded values
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    async def asend(self, value):
+        return self._check(await self._iterator.asend(value))
+
+    async def athrow(self, *args):
+        return self._check(await self._iterator.athrow(*args))
+
+    async def aclose(self):
+        await self._iterator.aclose()
+
+class _CheckedAsyncIterable:
+    """Proxy of an async iterable whose async iterators check the type of
+    each element. The other attributes are those of the iterable.
+    Parameters:
+        iterable - async iterable:
+            The async iterable to wrap
+        checker - function:
+            The checker of the elements
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __init__(self, iterable, checker, f_name, param_idx, function=None):
+        self._iterable = iterable
+        self._checker = checker
+        self._f_name = f_name
+        self._param_idx = param_idx
+        self._function = function
+
+    def __aiter__(self):
+        return _CheckedAsyncIterator(self._iterable.__aiter__(),
+                                     self._checker, self._f_name,
+                                     self._param_idx, self._function)
+
+    def __getattr__(self, name):
+        return getattr(self._iterable, name)
+
+def _async_wrapper(f, call):
+    """Build the wrapper of a coroutine function or an async generator
+    function, so that the decorated function is still recognized as such
+    (e.g. by inspect.iscoroutinefunction). The coroutine is awaited
+    directly and the async generator is iterated in place, without any extra
+    task.
+    Parameters:
+        f - function:
+            The coroutine function or the async generator function
+        call - function:
+            The synchronous wrapper, returning the coroutine or the async
+            generator
+    Returns:
+        function:
+            The wrapper
+    """
+    if inspect.isasyncgenfunction(f):
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            generator = call(*args, **kwargs)
+            # Forward the values sent and the exceptions thrown to the
+            # generator, like "yield from" does for generators
+            try:
+                elem = await generator.__anext__()
+                while True:
+                    try:
+                        value = yield elem
+                    except GeneratorExit:
+                        await generator.aclose()
+                        raise
+                    except BaseException as e:
+                        elem = await generator.athrow(e)
+                    else:
+                        elem = await generator.asend(value)
+            except StopAsyncIteration:
+                return
+        return wrapper
+
+    @functools.wraps(f)
+    async def wrapper(*args, **kwargs):
+        return await call(*args, **kwargs)
+    return wrapper
+
+def _is_async(f):
+    """Detect if a function is a coroutine function or an async generator
+    function, whose wrappers must be async too (see _async_wrapper).
+    Parameters:
+        f - function:
+            The decorated function
+    Returns:
+        bool:
+            True for a coroutine function or an async generator function
+    """
+    return inspect.iscoroutinefunction(f) or inspect.isasyncgenfunction(f)
+
+class _CheckedIterable:
+    """Proxy of an iterable whose iterators check the type of each element.
+    The other attributes are those of the iterable.
+    Parameters:
+        iterable - iterable:
+            The iterable to wrap
+        checker - function:
+            The checker of the elements
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        function - str or None:
+            The qualified name of the function, telling apart the violations
+            of the functions with the same name (see _Reporter)
+    """
+    def __init__(self, iterable, checker, f_name, param_idx, function=None):
+        self._iterable = iterable
+        self._checker = checker
+        self._f_name = f_name
+        self._param_idx = param_idx
+        self._function = function
+
+    def __iter__(self):
+        return _CheckedIterator(iter(self._iterable), self._checker,
+                                self._f_name, self._param_idx,
+                                self._function)
+
+    def __len__(self):
+        return len(self._iterable)
+
+    def __getattr__(self, name):
+        return getattr(self._iterable, name)
+
 def type_check(f_name, param_idx, arg, typ):
     """Check if the expected type 'typ' matches the type of the value.
     If the expected type is an iterable, iterate over all element and
     check their type as well, until all types are checked.
-    We iterate by layers, which represent the deepness of the architecture
     Example : Tuple[List[int], str]
     Layer 0 : Check if the argument is a tuple
     Layer 1 : Check if elements of tuple are List and str
-              Recognize List as a type from the typing module, and keep it
-              for the next layer
+              Recognize List as a type from the typing module, and check
+              its children
     Layer 2 : Check if the elements of the list are int. No types from
               the typing module found, stopping
-    If a type does not match, a TypeError exception is raised
+    The value is walked depth-first : each element is fully checked before
+    the next one, so that the memory used only depends on the depth of the
+    type, and the check stops at the first wrong element.
+    If a type does not match, a TypeError exception is raised.
+    The type is compiled once (see compile_type), further checks against the
+    same type reuse the compiled checker.
 
     Parameters:
         f_name - str:
@@ -100,292 +2031,1223 @@ def type_check(f_name, param_idx, arg, typ):
         None
 
     """
-    generic_alias = {list, dict, tuple, set}
-    types_to_check = [typ] # the expected types
-    args_to_check = [arg] # the actual values given
-    # If a type error is raised, we want to print the expected type architecture
-    # and the actual type architecture. For this we need to keep track of the
-    # architecture as we progress in the layers. The varialbe surroundings takes
-    # care of that by keeping the left and right string of the error message.
-    # Example : List[int, str]
-    # When inspecting the elements of the list, we have :
-    #   surrounding[0] = "List[" and
-    #   surrounding[1] = "]"
-    surroundings = [("", "")]
-
-    # Layer 0
-    for i in range(len(types_to_check)):
-        typ = types_to_check[i]
-        type_expected = typ.__origin__ if is_generic(typ) else typ
-        type_actual = type(args_to_check[i])
-
-        # If the type is any or union, we don't need to check the type
-        if typ is Any or get_name(typ) == "union":
-            pass
-        # If the type is a generic alias or a built-in type, we check the type
-        elif is_generic(typ) and typ.__origin__ in generic_alias:
-            if type_actual is not typ.__origin__:
-                raise TypeError(error_msg(f_name,
-                                          param_idx,
-                                          [typ.__origin__],
-                                          [type_actual],
-                                          surroundings[0]))
-        # if the type comes from the typing module, but none of the above
-        # applied, we raise an exception
-        elif getattr(typing, str(type(typ)).replace("typing.", ""), None):
-            raise(NotImplementedError("The type " + str(type(typ))
-                                      + " is not supported yet"))
-        # If the type is another type, we check it
-        elif type_actual is not typ:
-            raise TypeError(error_msg(f_name,
-                                      param_idx,
-                                      [typ],
-                                      [type_actual],
-                                      surroundings[0]))
-
-    # Layer 1+
-    while len(types_to_check) > 0:
-        new_types_to_check = []
-        new_args_to_check = []
-        new_surroundings = []
-
-        # Check all elements
-        for i in range(len(types_to_check)):
-            typ = types_to_check[i]
-            arg = args_to_check[i]
-            surrounding = surroundings[i]
-
-            # If the element is a typing.Union, we check if one of the child is
-            # of the correct type, and add it to the args to check
-            if get_name(typ) == "union":
-                left = surrounding[0] + "union["
-                right = "]" + surrounding[1]
-                new_surrounding = (left, right)
-                subtypes_expected = typ.__args__
-                subtypes_expected = [x.__origin__ if is_generic(x) else x
-                                         for x in subtypes_expected]
-                subtype_actual = type(arg)
-                # Check the type of the arg
-                idx_candidate = None
-                for j in range(len(subtypes_expected)):
-                    if subtype_actual is subtypes_expected[j]:
-                        idx_candidate = j
-                if idx_candidate is None:
-                    raise TypeError(error_msg(f_name,
-                                              param_idx,
-                                              subtypes_expected,
-                                              [subtype_actual],
-                                              new_surrounding))
-                # Check if the element is a generic alias and add it in this
-                # case
-                if is_generic(subtypes_expected[j]):
-                    left, right = get_surrounding(typ.__args__, idx_candidate)
-                    new_types_to_check.append(typ.__args__[idx_candidate])
-                    new_args_to_check.append(arg)
-                    current_surrounding = (new_surrounding[0] + left,
-                                           right + new_surrounding[1])
-                    new_surroundings.append(current_surrounding)
-            # Now check the children if the type is a generic_alias
-            elif is_generic(typ):
-                left = surrounding[0] + typ.__origin__.__name__ + "["
-                right = "]" + surrounding[1]
-                new_surrounding = (left, right)
-                # We need to check each type separately
-                # ---------------- tuple -------------------
-                # for tuple, we need to check if each children
-                # has the given type. The type may be different
-                # for each child
-                if typ.__origin__ is tuple:
-                    subtypes_expected = typ.__args__
-                    subtypes_expected = [x.__origin__ if is_generic(x) else x
-                                             for x in subtypes_expected]
-                    subtypes_actual = [type(x) for x in arg]
-                    # Check the type of all children
-                    for j in range(len(subtypes_expected)):
-                        if subtypes_expected[j] is not Any and \
-                           get_name(typ.__args__[j]) != "union" and \
-                           subtypes_expected[j]is not subtypes_actual[j]:
-                            raise TypeError(error_msg(f_name,
-                                                      param_idx,
-                                                      subtypes_expected,
-                                                      subtypes_actual,
-                                                      new_surrounding))
-                    # Check if there are other collections among children and
-                    # add them to the check list
-                    for j in range(len(subtypes_expected)):
-                        if is_generic(typ.__args__[j]) or \
-                           get_name(typ.__args__[j]) == "union":
-                            left, right = get_surrounding(typ.__args__, j)
-                            new_types_to_check.append(typ.__args__[j])
-                            new_args_to_check.append(arg[j])
-                            current_surrounding = (new_surrounding[0] + left,
-                                                   right + new_surrounding[1])
-                            new_surroundings.append(current_surrounding)
-                # -------------- set or list ----------------
-                # for set and list, we need to check if each children
-                # has the given type, which is the same for all
-                # children
-                elif typ.__origin__ is list or typ.__origin__ is set:
-                    subtype_expected = typ.__args__[0].__origin__ \
-                                        if is_generic(typ.__args__[0]) \
-                                        else typ.__args__[0]
-                    # Check the type of all children
-                    for elem in arg:
-                        subtype_actual = type(elem)
-                        if subtype_expected is not Any and \
-                           get_name(typ.__args__[0]) != "union" and \
-                           subtype_actual is not subtype_expected:
-                            raise TypeError(error_msg(f_name,
-                                                      param_idx,
-                                                      [subtype_expected],
-                                                      [subtype_actual],
-                                                      new_surrounding))
-                    # If the children are a collection, add them all to the
-                    # check list
-                    if is_generic(typ.__args__[0]) or \
-                       get_name(typ.__args__[0]) == "union":
-                        for elem in arg:
-                            new_types_to_check.append(typ.__args__[0])
-                            new_args_to_check.append(elem)
-                            new_surroundings.append(new_surrounding)
-                # ------------------ dict -------------------
-                # for dict, the children are key-value pairs,
-                # we need to check the types for both key and value
-                elif typ.__origin__ is dict:
-                    if str(typ.__args__[0]) != "~KT":
-                        # If the dict has expected key-value types (if not,
-                        # __args__ will return (~KT, ~VT))
-                        type_key_expected = typ.__args__[0].__origin__ \
-                                            if is_generic(typ.__args__[0]) \
-                                            else typ.__args__[0]
-                        type_value_expected = typ.__args__[1].__origin__ \
-                                            if is_generic(typ.__args__[1]) \
-                                            else typ.__args__[1]
-                        types_expected = [type_key_expected,
-                                          type_value_expected]
-
-                        # check the type of all key-value pairs
-                        for key in arg:
-                            if (type_key_expected is not Any and
-                                get_name(type_key_expected) != "union" and
-                                type(key) is not type_key_expected) or \
-                               (type_value_expected is not Any and
-                                get_name(type(arg[key])) != "union" and
-                                type(arg[key]) is not type_value_expected):
-                                types_actual = [type(key), type(arg[key])]
-                                raise TypeError(error_msg(f_name,
-                                                          param_idx,
-                                                          types_expected,
-                                                          types_actual,
-                                                          new_surrounding))
-                            # if the value is a collection, we add it to the
-                            # check list
-                            if is_generic(typ.__args__[1]) or \
-                               get_name(typ.__args__[1]) == "union":
-                                new_types_to_check.append(typ.__args__[1])
-                                new_args_to_check.append(arg[key])
-                                left = get_name(type_key_expected) + ", "
-                                current_surrounding = (new_surrounding[0] +left,
-                                                       new_surrounding[1])
-                                new_surroundings.append(current_surrounding)
-                else:
-                    raise ValueError("Unhandled type '" + str(typ) + "'")
-        types_to_check = new_types_to_check
-        args_to_check = new_args_to_check
-        surroundings = new_surroundings
-
-def accepts(*types, **kwargs_types):
-    """Decorator to check the parameter types
+    run_checker(compile_type(typ), f_name, param_idx, arg)
+
+def run_checker(checker, f_name, param_idx, arg):
+    """Run a compiled checker on a value and convert a mismatch into a
+    TypeError with the usual error message.
+    Parameters:
+        checker - function:
+            The checker returned by compile_type
+        f_name - str:
+            The name of the function being type-checked
+        param_idx - int or str:
+            The parameter position (or name), -1 for the return value
+        arg - unknown:
+            The object to type-check
+    Returns:
+        None
+    """
+    try:
+        checker(arg)
+    except _Mismatch as e:
+        raise e.to_type_error(f_name, param_idx) from None
+
+def set_sample_size(sample):
+    """Set the maximum number of elements checked in each list, set or dict by
+    the decorators that do not specify it. Checking a bounded subset of the
+    elements catches most errors on large containers without paying for a
+    full scan.
+    Parameters:
+        sample - int or None:
+            The maximum number of elements checked, or None to check all of
+            them
+    Returns:
+        None
+    """
+    global _sample_size
+    _check_sample(sample)
+    _sample_size = sample
+
+def get_sample_size():
+    """Get the maximum number of elements checked in each container by the
+    decorators that do not specify it (see set_sample_size).
+    Returns:
+        int or None:
+            The maximum number of elements checked, None if all of them are
+    """
+    return _sample_size
+
+def set_cache_size(size):
+    """Enable the validation cache of immutable values. A tuple or a frozenset
+    already checked against the same type is then not checked again, as long
+    as it is one of the 'size' values most recently checked. Frozensets are
+    weakly referenced and leave the cache when they are deleted, tuples
+    cannot be weakly referenced and are kept alive while they are in the
+    cache.
+    Parameters:
+        size - int or None:
+            The maximum number of values in the cache, or None to disable it
+    Returns:
+        None
+    """
+    global _cache, _cache_size
+    if size is not None and (type(size) is not int or size < 1):
+        raise ValueError("The cache size must be a positive int or None, got "
+                         + repr(size))
+    _cache_size = size
+    _cache = None if size is None else collections.OrderedDict()
+
+def get_cache_size():
+    """Get the maximum number of values in the validation cache (see
+    set_cache_size).
+    Returns:
+        int or None:
+            The maximum number of values, None if the cache is disabled
+    """
+    return _cache_size
+
+class _FunctionStats:
+    """Runtime statistics of the checks of a decorated function.
+    Attributes:
+        calls - int:
+            The number of calls checked
+        check_ns - int:
+            The total time spent in the checks, in nanoseconds
+        max_check_ns - int:
+            The longest single check (of the arguments or of the return
+            value), in nanoseconds
+        elements - int:
+            The number of values checked, a list, set, tuple or dict counting
+            for the number of its elements
+        violations - int:
+            The number of checks that raised a TypeError
+    """
+    __slots__ = ("calls", "check_ns", "max_check_ns", "elements",
+                 "violations")
+
+    def __init__(self):
+        self.calls = 0
+        self.check_ns = 0
+        self.max_check_ns = 0
+        self.elements = 0
+        self.violations = 0
+
+    def as_dict(self):
+        """Get the statistics as a dict, e.g. to serialize them.
+        Returns:
+            dict:
+                The statistics, by attribute name
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def _stats_key(f):
+    """Get the name of a function in the statistics (see get_stats).
+    Parameters:
+        f - function:
+            The decorated function
+    Returns:
+        str:
+            The qualified name of the function, with its module
+    """
+    return f.__module__ + "." + getattr(f, "__qualname__", f.__name__)
+
+def _mark_nested(f, wrapper):
+    """Mark the checked function wrapped by another decorator, so that the
+    calls are only counted once in the statistics, by the outermost
+    decorator (see _record_check).
+    Parameters:
+        f - function:
+            The decorated function
+        wrapper - function:
+            The wrapper of the decorator
+    Returns:
+        None
+    """
+    # The attribute is set after functools.wraps copied the attributes of f
+    wrapper._nested = False
+    if getattr(f, "_typechecked", False):
+        f._nested = True
+
+# Containers counting for their number of elements in the statistics
+_counted_types = (list, tuple, set, frozenset, dict)
+
+def _record_check(key, count_call, start, values, failed):
+    """Add a check to the statistics of a function.
+    Parameters:
+        key - str:
+            The name of the function (see _stats_key)
+        count_call - bool:
+            True if the check counts as a call of the function
+        start - int:
+            The time the check started, from time.perf_counter_ns
+        values - iterable:
+            The values checked
+        failed - bool:
+            True if the check raised a TypeError
+    Returns:
+        None
+    """
+    elapsed = time.perf_counter_ns() - start
+    stats = _stats
+    if stats is None:
+        # Disabled during the check
+        return
+    entry = stats.get(key)
+    if entry is None:
+        entry = stats[key] = _FunctionStats()
+    if count_call:
+        entry.calls += 1
+    entry.check_ns += elapsed
+    if elapsed > entry.max_check_ns:
+        entry.max_check_ns = elapsed
+    for value in values:
+        entry.elements += len(value) if type(value) in _counted_types else 1
+    if failed:
+        entry.violations += 1
+
+def set_stats_enabled(enabled):
+    """Enable or disable the runtime statistics of the decorated functions :
+    the number of calls, the time spent in the checks, the number of values
+    checked and the number of violations (see get_stats). They show which
+    functions are worth sampling (see set_sample_size) or turning off (see
+    set_check_level). When disabled, they cost a single test per call.
+    Disabling them discards the statistics collected.
+    Parameters:
+        enabled - bool:
+            True to collect the statistics
+    Returns:
+        None
+    """
+    global _stats
+    if not enabled:
+        _stats = None
+    elif _stats is None:
+        _stats = {}
+
+def reset_stats():
+    """Discard the statistics collected so far (see set_stats_enabled).
+    Returns:
+        None
+    """
+    if _stats is not None:
+        _stats.clear()
+
+def get_stats(name=None):
+    """Get the statistics collected since they were enabled (see
+    set_stats_enabled). The elements of the iterators checked lazily are not
+    counted.
+    Parameters:
+        name - str or None:
+            The qualified name of a function, with its module (e.g.
+            "myapp.models.Foo.bar"), or None for all the functions
+    Returns:
+        dict:
+            The statistics of the function (see _FunctionStats), or a dict of
+            statistics by function name if 'name' is None. A function never
+            checked has empty statistics
+    """
+    stats = _stats or {}
+    if name is not None:
+        return stats.get(name, _FunctionStats()).as_dict()
+    return {key: entry.as_dict() for key, entry in sorted(stats.items())}
+
+def dump_stats(file=None):
+    """Write the statistics of all the functions as JSON (see get_stats).
+    Parameters:
+        file - str, file object or None:
+            The path or the file to write to, or None to return the JSON
+            instead
+    Returns:
+        str or None:
+            The JSON if 'file' is None
+    """
+    stats = get_stats()
+    if file is None:
+        return json.dumps(stats, indent=2)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w") as f:
+            json.dump(stats, f, indent=2)
+    else:
+        json.dump(stats, file, indent=2)
+
+class ViolationBuffer:
+    """Sink keeping the last violations reported (see set_violation_sink),
+    e.g. to expose them on a debug endpoint.
+    Parameters:
+        size - int:
+            The maximum number of violations kept, the oldest ones being
+            dropped first
+    Attributes:
+        violations - collections.deque:
+            The violations, as (message, count) pairs, count being the number
+            of occurrences since the previous report of the same violation
+    """
+    def __init__(self, size=100):
+        self.violations = collections.deque(maxlen=size)
+
+    def __call__(self, error, count):
+        self.violations.append((str(error), count))
+
+def _logging_sink(target, level):
+    """Build a sink logging the violations (see set_violation_sink).
+    Parameters:
+        target - logging.Logger or logging.Handler:
+            The logger or the handler to log to
+        level - int:
+            The level of the log records
+    Returns:
+        function:
+            The sink
+    """
+    def log(error, count):
+        msg = str(error)
+        if count > 1:
+            msg += "\n(" + str(count) + " occurrences)"
+        if isinstance(target, logging.Logger):
+            target.log(level, msg)
+        else:
+            target.handle(logging.makeLogRecord({"name": __name__,
+                                                 "levelno": level,
+                                                 "levelname":
+                                                 logging.getLevelName(level),
+                                                 "msg": msg}))
+    return log
+
+class _Reporter:
+    """Send the violations to a sink instead of raising them, at most once
+    per 'interval' for the same violation. Two violations are the same if
+    they come from the same function (by qualified name, with its module)
+    and have the same message, i.e. the same parameter, and expected and
+    actual types.
+    Parameters:
+        sink - function:
+            A function taking the TypeError and the number of occurrences
+            since the last report of the same violation
+        interval - float:
+            The minimum time between two reports of the same violation, in
+            seconds
+    """
+    # Maximum number of violations remembered, the oldest ones being
+    # forgotten first
+    max_violations = 4096
+
+    def __init__(self, sink, interval):
+        self.sink = sink
+        self.interval = interval
+        # Time of the last report and number of occurrences since, by
+        # function and message
+        self.seen = collections.OrderedDict()
+        # The checked functions can be called from several threads at once
+        self.lock = threading.Lock()
+
+    def report(self, error, function=None):
+        """Report a violation, unless the same one was reported recently.
+        Parameters:
+            error - TypeError:
+                The violation, as built by the checks
+            function - str or None:
+                The qualified name of the function, with its module (see
+                _stats_key), as the message only has its name
+        Returns:
+            None
+        """
+        violation = (function, str(error))
+        with self.lock:
+            now = time.monotonic()
+            entry = self.seen.get(violation)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return
+            count = 1 if entry is None else entry[1] + 1
+            self.seen[violation] = [now, 0]
+            self.seen.move_to_end(violation)
+            if len(self.seen) > self.max_violations:
+                self.seen.popitem(last=False)
+        # The sink is called outside of the lock, as it can be slow (e.g. a
+        # logging handler writing to the network)
+        self.sink(error, count)
+
+def set_violation_sink(sink, interval=60.0, level=logging.WARNING):
+    """Report the violations to a sink instead of raising a TypeError, e.g.
+    to check the types in production without risking an outage. The checks
+    of a call stop at the first violation, which is reported with the usual
+    error message, and the function is called anyway. The same violation is
+    reported at most once per 'interval'.
+    Parameters:
+        sink - function, logging.Logger, logging.Handler, ViolationBuffer
+               or None:
+            Where to report the violations : a function taking the TypeError
+            and the number of occurrences since the last report of the same
+            violation, a logger or a handler, a ViolationBuffer, or None to
+            raise the violations again (default)
+        interval - float:
+            The minimum time between two reports of the same violation, in
+            seconds
+        level - int:
+            The level of the log records, for a logger or a handler
+    Returns:
+        None
+    """
+    global _reporter
+    if sink is None:
+        _reporter = None
+        return
+    if interval < 0:
+        raise ValueError("The interval must be positive, got "
+                         + repr(interval))
+    if isinstance(sink, (logging.Logger, logging.Handler)):
+        sink = _logging_sink(sink, level)
+    elif not callable(sink):
+        raise ValueError("The sink must be callable, a logger or a handler, "
+                         + "got " + repr(sink))
+    _reporter = _Reporter(sink, interval)
+
+def get_violation_sink():
+    """Get the function the violations are reported to (see
+    set_violation_sink).
+    Returns:
+        function or None:
+            The sink, None if the violations raise a TypeError
+    """
+    return None if _reporter is None else _reporter.sink
+
+def _check_sample(sample):
+    """Raise a ValueError if 'sample' is not a valid sample size.
+    Parameters:
+        sample - unknown:
+            The sample size to validate
+    Returns:
+        None
+    """
+    if sample is not None and (type(sample) is not int or sample < 1):
+        raise ValueError("The sample size must be a positive int or None, got "
+                         + repr(sample))
+
+def _checkers_getter(compile_all, sample, module):
+    """Build a function returning the checkers of a decorator for the check
+    level of its module and the sample size in use. The checkers are compiled
+    once per level and sample size, the first ones right away, when the
+    decorator is applied.
+    Parameters:
+        compile_all - function:
+            A function compiling the checkers of the decorator for a given
+            sample size and depth (True for a shallow check)
+        sample - int or None:
+            The sample size of the decorator, or None to follow the global
+            setting
+        module - str:
+            The name of the module of the decorated function
+    Returns:
+        function:
+            A function without parameter returning the compiled checkers, or
+            None if the checks are turned off
+    """
+    compiled = {}
+    # The level is only looked up again when a level is changed
+    generation = None
+    level = None
+
+    def get_checkers():
+        nonlocal generation, level
+        if generation != _level_generation:
+            level = get_check_level(module)
+            generation = _level_generation
+        if level == "off":
+            return None
+        size = _sample_size if sample is None else sample
+        try:
+            return compiled[(level, size)]
+        except KeyError:
+            checkers = compiled[(level, size)] = \
+                compile_all(size, level == "shallow")
+            return checkers
+    get_checkers()
+    return get_checkers
+
+def set_check_level(level, module=None):
+    """Set how much the decorators check, for the whole process or for the
+    functions of a module or a package. The change applies right away to the
+    functions already decorated, except that the decorators applied while the
+    level was "off" returned the function untouched and never check it.
+    Parameters:
+        level - str:
+            One of
+            - "off" : nothing is checked. Functions decorated in this state
+              are returned as is, without any overhead
+            - "shallow" : only the type of the values themselves is checked,
+              not their children (e.g. a list, but not its elements)
+            - "full" : everything is checked (default)
+        module - str or None:
+            The name of a module or a package the level applies to (e.g.
+            "myapp.rpc"), or None to set the default level. The level of the
+            longest matching name is used
+    Returns:
+        None
+    """
+    global _level_generation
+    if level not in _check_levels:
+        raise ValueError("Unknown check level '" + str(level)
+                         + "', expected one of " + ", ".join(_check_levels))
+    _module_levels[module or ""] = level
+    _level_generation += 1
+
+def get_check_level(module=None):
+    """Get the check level of a module (see set_check_level).
+    Parameters:
+        module - str or None:
+            The name of the module, or None for the default level
+    Returns:
+        str:
+            The check level
+    """
+    name = module or ""
+    while name not in _module_levels:
+        name = name.rpartition(".")[0]
+    return _module_levels[name]
+
+def _load_check_levels(setting):
+    """Set the check levels from a setting such as the TYPECHECK_LEVEL
+    environment variable : a comma separated list of levels, either alone for
+    the default level, or as module=level (e.g. "shallow,myapp.rpc=off").
+    Parameters:
+        setting - str:
+            The setting to load
+    Returns:
+        None
+    """
+    for item in setting.split(","):
+        module, _, level = item.strip().rpartition("=")
+        if level:
+            set_check_level(level.strip(), module.strip() or None)
+
+# The levels can be set before the program starts, e.g.
+# TYPECHECK_LEVEL="shallow,myapp.rpc=off"
+_load_check_levels(os.environ.get("TYPECHECK_LEVEL", ""))
+
+# Marks the *args and **kwargs parameters without an expected type
+_untyped = object()
+
+def _binding_plan(f, types, kwargs_types):
+    """Match the expected types of accepts with the parameters of 'f', once,
+    when the decorator is applied. The types are given in order to the
+    positional parameters, the first parameter being skipped if it is named
+    self or cls and not given a type (i.e. if there are less types than
+    positional parameters). The keyword types name any parameter, including
+    the *args and **kwargs parameters, whose elements are then all expected
+    to have the given type. The types beyond the positional parameters are
+    those of the first elements of *args.
+    Parameters:
+        f - function:
+            The decorated function
+        types - tuple:
+            The expected types given by position
+        kwargs_types - dict:
+            The expected types given by name
+    Returns:
+        tuple:
+            - the number of parameters skipped (0 or 1, for self or cls)
+            - the positional slots, a tuple of (name, has default) pairs,
+              the name being None for the elements of *args
+            - the expected types of the slots
+            - the expected type of the other elements of *args, or _untyped
+            - the expected types of the keyword arguments, by name
+            - the expected type of the other keyword arguments, or _untyped
+            - the names of all the named parameters
+    """
+    try:
+        params = list(inspect.signature(f).parameters.values())
+    except (TypeError, ValueError):
+        # No signature (e.g. some builtins), the function is handled as if
+        # it was f(*args, **kwargs)
+        params = [inspect.Parameter("args", inspect.Parameter.VAR_POSITIONAL),
+                  inspect.Parameter("kwargs", inspect.Parameter.VAR_KEYWORD)]
+    positional = [x for x in params
+                  if x.kind in (inspect.Parameter.POSITIONAL_ONLY,
+                                inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    var_positional = [x.name for x in params
+                      if x.kind == inspect.Parameter.VAR_POSITIONAL]
+    var_keyword = [x.name for x in params
+                   if x.kind == inspect.Parameter.VAR_KEYWORD]
+    kwargs_types = dict(kwargs_types)
+    var_type = kwargs_types.pop(var_positional[0], _untyped) \
+               if var_positional else _untyped
+    var_keyword_type = kwargs_types.pop(var_keyword[0], _untyped) \
+                       if var_keyword else _untyped
+
+    offset = 0
+    if positional and positional[0].name in ("self", "cls") and \
+       len(types) < len(positional) and positional[0].name not in kwargs_types:
+        offset = 1
+    named = positional[offset:]
+    if len(types) > len(named) and not var_positional:
+        raise ValueError("Mismatch count of parameters/types ("
+                         + str(len(named)) + "/" + str(len(types)) + ")")
+
+    # The types given by position, then the following parameters typed by
+    # name, which can also be given by position
+    slots = []
+    slot_types = []
+    for i in range(len(types)):
+        if i < len(named):
+            if named[i].name in kwargs_types:
+                raise ValueError("Two types specified for parameter '"
+                                 + named[i].name + "'")
+            slots.append((named[i].name,
+                          named[i].default is not inspect.Parameter.empty))
+        else:
+            slots.append((None, False))
+        slot_types.append(types[i])
+    for param in named[len(types):]:
+        if param.name not in kwargs_types:
+            break
+        slots.append((param.name,
+                      param.default is not inspect.Parameter.empty))
+        slot_types.append(kwargs_types[param.name])
+
+    keyword_types = {}
+    for (name, has_default), typ in zip(slots, slot_types):
+        if name is not None:
+            keyword_types[name] = typ
+    names = frozenset(x.name for x in params
+                      if x.kind not in (inspect.Parameter.VAR_POSITIONAL,
+                                        inspect.Parameter.VAR_KEYWORD))
+    for name, typ in kwargs_types.items():
+        if name not in names and not var_keyword:
+            raise ValueError("Type specified for unknown parameter '"
+                             + name + "'")
+        keyword_types[name] = typ
+    # Positional-only parameters cannot be given by name
+    for param in positional:
+        if param.kind == inspect.Parameter.POSITIONAL_ONLY:
+            keyword_types.pop(param.name, None)
+    return (offset, tuple(slots), slot_types, var_type, keyword_types,
+            var_keyword_type, names)
+
+def _compile_param(typ, size, shallow):
+    """Compile the checks of a parameter.
+    Parameters:
+        typ - type or typing._GenericAlias:
+            The expected type
+        size - int or None:
+            The sample size (see compile_type)
+        shallow - bool:
+            True for a shallow check (see compile_type)
+    Returns:
+        tuple:
+            The checker (None for Any) and the wrapper (see compile_wrapper,
+            None if not needed)
+    """
+    if typ == Any:
+        return (None, None)
+    return (compile_type(typ, size, shallow),
+            None if shallow else compile_wrapper(typ, size))
+
+def accepts(*types, sample=None, **kwargs_types):
+    """Decorator to check the parameter types. The parameters of the
+    decorated function are matched with the types once, when the decorator is
+    applied (see _binding_plan), so that a call only runs the checks.
 
     Parameters:
         types - tuple:
-            The expected types of the argument given to the decorated function
+            The expected types of the argument given to the decorated
+            function, in order. The first parameter does not need a type if
+            it is named self or cls
+        sample - int or None:
+            The maximum number of elements checked in each list, set or dict,
+            or None to use the global setting (see set_sample_size)
+        kwargs_types - dict:
+            The expected types of the parameters, by name. The type of the
+            *args (or **kwargs) parameter is the type of each of its elements
+            (or values)
     Returns:
         function:
             A decorator wrapping the function to check its arguments before
             running it
     """
+    _check_sample(sample)
+    return _accepts_decorator(types, kwargs_types, sample)
+
+def _accepts_decorator(types, kwargs_types, sample):
+    """Build the decorator of accepts (see accepts). The keyword types are
+    given as a dict, so that a parameter can be named 'sample'.
+    Parameters:
+        types - tuple:
+            The expected types given by position
+        kwargs_types - dict:
+            The expected types given by name
+        sample - int or None:
+            The sample size of the decorator
+    Returns:
+        function:
+            The decorator
+    """
     def decorator(f):
+        if get_check_level(f.__module__) == "off":
+            return f
+        offset, slots, slot_types, var_type, keyword_types, \
+            var_keyword_type, names = _binding_plan(f, types, kwargs_types)
+        count = len(slots)
+        f_name = f.__name__
+
+        def compile_all(size, shallow):
+            # Only the positional arguments that are not Any are kept
+            positional = []
+            for i in range(count):
+                checker, wrap = _compile_param(slot_types[i], size, shallow)
+                if checker is not None:
+                    positional.append((i, checker, wrap))
+            return (tuple(positional),
+                    None if var_type is _untyped
+                    else _compile_param(var_type, size, shallow),
+                    {name: _compile_param(typ, size, shallow)
+                     for name, typ in keyword_types.items()},
+                    None if var_keyword_type is _untyped
+                    else _compile_param(var_keyword_type, size, shallow))
+
+        get_checkers = _checkers_getter(compile_all, sample, f.__module__)
+
+        key = _stats_key(f)
+
+        def mismatch(given):
+            return ValueError("Mismatch count of args/types (" + str(given)
+                              + "/" + str(count) + ")")
+
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            if len(args) != len(types):
-                raise ValueError("Mismatch count of args/types ("
-                                 + str(len(args)) + "/"
-                                 + str(len(types)) + ")")
-            if len(kwargs) > len(kwargs_types):
-                raise ValueError("More kwargs given than types specified")
-            # Check the type for each argument
-            for i in range(len(args)):
-                if types[i] != Any:
-                    type_check(f.__name__, i, args[i], types[i])
-            # Check the type for each keyword argument
-            for i, v in enumerate(kwargs.items()):
-                if v[0] not in kwargs_types:
-                    raise ValueError(f"Type not specified for kwargs '{v[0]}'")
-                expected_type = kwargs_types[v[0]]
-                if expected_type != Any:
-                    type_check(f.__name__, v[0], v[1], expected_type)
-            return f(*args)
+            compiled = get_checkers()
+            if compiled is None:
+                return f(*args, **kwargs)
+            positional, var_positional, keywords, var_keyword = compiled
+            # The statistics only cost this test when they are disabled
+            stats = _stats
+            if stats is not None:
+                start = time.perf_counter_ns()
+            try:
+                given = len(args) - offset
+                if given < count:
+                    # The missing slots must have a default or be given by
+                    # name
+                    for name, has_default in slots[max(given, 0):]:
+                        if name is None or \
+                           (not has_default and name not in kwargs):
+                            raise mismatch(given)
+                elif given > count and var_positional is None:
+                    raise mismatch(given)
+                wrapped = None
+                # Check the type for each argument given by position
+                for i, checker, wrap in positional:
+                    if i >= given:
+                        break
+                    arg = args[offset + i]
+                    run_checker(checker, f_name, i, arg)
+                    if wrap is not None:
+                        # Wrap the iterators to check their elements when
+                        # consumed
+                        if wrapped is None:
+                            wrapped = list(args)
+                        wrapped[offset + i] = wrap(arg, f_name, i, key)
+                # Check the other elements of *args
+                if given > count and var_positional[0] is not None:
+                    checker, wrap = var_positional
+                    for i in range(count, given):
+                        arg = args[offset + i]
+                        run_checker(checker, f_name, i, arg)
+                        if wrap is not None:
+                            if wrapped is None:
+                                wrapped = list(args)
+                            wrapped[offset + i] = wrap(arg, f_name, i, key)
+                if wrapped is not None:
+                    args = wrapped
+                # Check the type for each keyword argument
+                if kwargs:
+                    for name, value in kwargs.items():
+                        pair = keywords.get(name)
+                        if pair is None:
+                            if var_keyword is None or name in names:
+                                raise ValueError("Type not specified for "
+                                                 + "kwargs '" + name + "'")
+                            pair = var_keyword
+                        checker, wrap = pair
+                        if checker is not None:
+                            run_checker(checker, f_name, name, value)
+                            if wrap is not None:
+                                kwargs[name] = wrap(value, f_name, name, key)
+            except TypeError as error:
+                if stats is not None:
+                    _record_check(key, not wrapper._nested, start,
+                                  itertools.chain(args[offset:],
+                                                  kwargs.values()),
+                                  True)
+                if _reporter is None:
+                    raise
+                # The remaining arguments are not checked, a wrong call
+                # costs no more than a right one
+                _reporter.report(error, key)
+                return f(*args, **kwargs)
+            if stats is not None:
+                _record_check(key, not wrapper._nested, start,
+                              itertools.chain(args[offset:],
+                                              kwargs.values()),
+                              False)
+            return f(*args, **kwargs)
+        if _is_async(f):
+            # The checks of the arguments are run when the coroutine is
+            # awaited. The synchronous wrapper reads 'wrapper' from this
+            # scope, hence sees the attributes of the async wrapper
+            wrapper = _async_wrapper(f, wrapper)
+        wrapper._typechecked = True
+        _mark_nested(f, wrapper)
         return wrapper
     return decorator
 
 
-def returns(typ):
+def returns(typ, sample=None):
     """Decorator to check the return types
 
     Parameters:
         types - tuple:
             The expected types of the return values of the decorated
             function
+        sample - int or None:
+            The maximum number of elements checked in each list, set or dict,
+            or None to use the global setting (see set_sample_size)
     Returns:
         function:
             A decorator wrapping the function to check its return values
             after running it
     """
+    _check_sample(sample)
+
+    def compile_all(size, shallow):
+        if typ is None:
+            return (None, None)
+        return (compile_type(typ, size, shallow),
+                None if shallow else compile_wrapper(typ, size))
+
     def decorator(f):
+        if get_check_level(f.__module__) == "off":
+            return f
+        get_checker = _checkers_getter(compile_all, sample, f.__module__)
+        key = _stats_key(f)
+
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            result = f(*args, **kwargs)
-            if typ is None and result is not None:
-                raise TypeError("Type error on return value of method '"
-                                + f.__name__ + "' :\n"
-                                + "             Expected : NoneType\n"
-                                + "             Have     : "
-                                + type(result).__name__)
-            elif typ is not None:
-                type_check(f.__name__, -1, result, typ)
+            compiled = get_checker()
+            if compiled is None:
+                return f(*args, **kwargs)
+            return check(compiled, f(*args, **kwargs))
+
+        if inspect.iscoroutinefunction(f):
+            # The awaited result is checked, not the coroutine
+            @functools.wraps(f)
+            async def wrapper(*args, **kwargs):
+                compiled = get_checker()
+                if compiled is None:
+                    return await f(*args, **kwargs)
+                return check(compiled, await f(*args, **kwargs))
+        elif inspect.isasyncgenfunction(f):
+            wrapper = _async_wrapper(f, wrapper)
+
+        def check(compiled, result):
+            checker, wrap = compiled
+            stats = _stats
+            if stats is not None:
+                start = time.perf_counter_ns()
+            try:
+                if typ is None and result is not None:
+                    raise TypeError("Type error on return value of method '"
+                                    + f.__name__ + "' :\n"
+                                    + "             Expected : NoneType\n"
+                                    + "             Have     : "
+                                    + type(result).__name__)
+                elif checker is not None:
+                    run_checker(checker, f.__name__, -1, result)
+                    if wrap is not None:
+                        # Check the elements of the iterator when consumed
+                        result = wrap(result, f.__name__, -1, key)
+            except TypeError as error:
+                if stats is not None:
+                    _record_check(key, not wrapper._nested, start,
+                                  (result,), True)
+                if _reporter is None:
+                    raise
+                _reporter.report(error, key)
+            if stats is not None:
+                _record_check(key, not wrapper._nested, start, (result,),
+                              False)
             return result
+        wrapper._typechecked = True
+        _mark_nested(f, wrapper)
         return wrapper
     return decorator
 
-def error_msg(fname, param_idx, expected, actual, surrounding):
+def typechecked(f=None, *, sample=None):
+    """Decorator to check the parameter and return types from the annotations
+    of the function. The annotations are resolved with typing.get_type_hints
+    on the first call only, so that forward references and
+    "from __future__ import annotations" are supported, and the checks are
+    then those of accepts and returns. The parameters without annotation are
+    not checked.
+    It can be used with or without arguments, e.g. @typechecked or
+    @typechecked(sample=100).
+
+    Parameters:
+        f - function or None:
+            The function to decorate, None when arguments are given
+        sample - int or None:
+            The maximum number of elements checked in each list, set or dict,
+            or None to use the global setting (see set_sample_size)
+    Returns:
+        function:
+            The decorated function, or a decorator if 'f' is None
+    """
+    _check_sample(sample)
+    if f is None:
+        return functools.partial(typechecked, sample=sample)
+    return _typechecked(f, sample, True)
+
+def _typechecked(f, sample, strict):
+    """Decorate a function with typechecked (see typechecked).
+    Parameters:
+        f - function:
+            The function to decorate
+        sample - int or None:
+            The sample size of the decorators
+        strict - bool:
+            If True, the annotations that cannot be resolved or checked raise
+            an error on the first call, otherwise they are not checked (see
+            _checkable_hints)
+    Returns:
+        function:
+            The decorated function
+    """
+    _check_sample(sample)
+    if get_check_level(f.__module__) == "off":
+        return f
+    checked = None
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        nonlocal checked
+        if checked is None:
+            checked = _annotations_checked(f, sample, strict)
+        return checked(*args, **kwargs)
+    if _is_async(f):
+        wrapper = _async_wrapper(f, wrapper)
+    # The checked functions are marked, so that typechecker.instrument does
+    # not decorate them twice
+    wrapper._typechecked = True
+    return wrapper
+
+# Names, possibly dotted, found in the annotations (see _SchemaCache._key)
+_annotation_names = re.compile(r"[A-Za-z_][\w.]*")
+
+class _SchemaCache:
+    """Resolved annotations of the functions checked by typechecked, kept in
+    a file between two runs of the program (see set_schema_cache). The
+    entries are indexed by the module and the qualified name of the
+    function, and hold a hash of its annotations, of the values of the names
+    they use and of its source file, so that an entry is ignored once the
+    source changes.
+    Parameters:
+        path - str:
+            The path of the cache file, loaded if it exists
+    """
+    def __init__(self, path):
+        self.path = path
+        # (hash, pickled annotations) pairs, by (module, qualified name)
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(path, "rb") as f:
+                version, entries = pickle.load(f)
+        except (OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            return
+        # The pickled types may differ between two versions of Python
+        if version == sys.version:
+            self.entries = entries
+
+    @staticmethod
+    def _key(f):
+        """Get the index and the hash of the entry of a function.
+        Parameters:
+            f - function:
+                The function
+        Returns:
+            tuple:
+                The index and the hash
+        """
+        digest = hashlib.sha256()
+        for name, annotation in f.__annotations__.items():
+            digest.update((name + ":" + repr(annotation) + ";").encode())
+        # The names used in the annotations may be imported from another
+        # module (e.g. a type alias) : their current values are hashed, and
+        # so are the values of the names these use in turn (e.g. the forward
+        # references of an alias)
+        namespace = getattr(f, "__globals__", {})
+        pending = [repr(x) for x in f.__annotations__.values()]
+        seen = set()
+        while pending:
+            for name in _annotation_names.findall(pending.pop()):
+                if name in seen:
+                    continue
+                seen.add(name)
+                parts = name.split(".")
+                if parts[0] not in namespace:
+                    continue
+                value = namespace[parts[0]]
+                for part in parts[1:]:
+                    value = getattr(value, part, None)
+                text = repr(value)
+                digest.update((name + "=" + text + ";").encode())
+                if not isinstance(value, types.ModuleType):
+                    pending.append(text)
+        # The names used in the annotations may be defined elsewhere in the
+        # source file
+        filename = f.__code__.co_filename
+        try:
+            stat = os.stat(filename)
+            digest.update((filename + ":" + str(stat.st_mtime_ns) + ":"
+                           + str(stat.st_size)).encode())
+        except OSError:
+            digest.update(filename.encode())
+        return ((f.__module__, f.__qualname__), digest.hexdigest())
+
+    def get(self, f):
+        """Get the resolved annotations of a function.
+        Parameters:
+            f - function:
+                The function
+        Returns:
+            dict or None:
+                The annotations, as typing.get_type_hints returns them, or
+                None if they are not in the cache or not up to date
+        """
+        key, digest = self._key(f)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != digest:
+            return None
+        try:
+            return pickle.loads(entry[1])
+        except Exception:
+            # e.g. a type that was moved or renamed
+            return None
+
+    def put(self, f, hints):
+        """Add the resolved annotations of a function. The annotations that
+        cannot be pickled (e.g. local classes) are not kept.
+        Parameters:
+            f - function:
+                The function
+            hints - dict:
+                The annotations, as typing.get_type_hints returns them
+        Returns:
+            None
+        """
+        key, digest = self._key(f)
+        try:
+            data = pickle.dumps(hints)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        self.entries[key] = (digest, data)
+        self.changed = True
+
+    def save(self):
+        """Write the cache file if entries were added. The file is replaced
+        at once, so that a program starting meanwhile never reads a partial
+        file.
+        Returns:
+            None
+        """
+        if not self.changed:
+            return
+        tmp = self.path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((sys.version, self.entries), f)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+# Cache of the resolved annotations (see set_schema_cache), None when
+# disabled
+_schema_cache = None
+
+def set_schema_cache(path):
+    """Keep the resolved annotations of the functions checked by typechecked
+    in a file, so that the next runs of the program load them instead of
+    resolving them again with typing.get_type_hints, which is most of the
+    cost of the first call of a function. The file is written when the
+    program exits (or by save_schema_cache). An entry is ignored once the
+    annotations of its function, the values of the names they use (e.g. an
+    imported type alias) or its source file change. The checkers are still
+    compiled from the annotations, as they cannot be serialized. Only
+    typechecked (and typechecker.instrument) resolve annotations : accepts
+    and returns are given the types directly, and do not use the cache.
+    The file is loaded with pickle, it must only be writable by trusted
+    users.
+    Parameters:
+        path - str or None:
+            The path of the cache file, or None to disable the cache
+            (default)
+    Returns:
+        None
+    """
+    global _schema_cache
+    if _schema_cache is not None:
+        _schema_cache.save()
+    _schema_cache = None if path is None else _SchemaCache(os.fspath(path))
+
+def save_schema_cache():
+    """Write the cache of the resolved annotations now (see
+    set_schema_cache), e.g. once the program is warmed up.
+    Returns:
+        None
+    """
+    if _schema_cache is not None:
+        _schema_cache.save()
+
+atexit.register(save_schema_cache)
+
+# The cache can be set before the program starts, e.g.
+# TYPECHECK_SCHEMA_CACHE="/var/cache/myapp/types.cache"
+set_schema_cache(os.environ.get("TYPECHECK_SCHEMA_CACHE") or None)
+
+def _type_hints(f):
+    """Resolve the annotations of a function, from the cache if possible
+    (see set_schema_cache).
+    Parameters:
+        f - function:
+            The function
+    Returns:
+        dict:
+            The annotations, as typing.get_type_hints returns them
+    """
+    cache = _schema_cache
+    if cache is None:
+        return typing.get_type_hints(f)
+    hints = cache.get(f)
+    if hints is None:
+        hints = typing.get_type_hints(f)
+        cache.put(f, hints)
+    return hints
+
+def _checkable_hints(f, sample):
+    """Resolve and compile the annotations of a function one at a time, so
+    that those that cannot be resolved (e.g. names imported under
+    typing.TYPE_CHECKING) or checked (e.g. Callable[[int], int]) are replaced
+    by Any instead of making every call fail. A warning is emitted for the
+    annotations that are left out.
+    Parameters:
+        f - function:
+            The function
+        sample - int or None:
+            The sample size of the decorators
+    Returns:
+        dict:
+            The annotations, as typing.get_type_hints returns them
+    """
+    errors = {}
+    try:
+        hints = _type_hints(f)
+    except Exception:
+        hints = {}
+        for name, annotation in f.__annotations__.items():
+            # A copy of the function holding a single annotation
+            single = types.FunctionType(f.__code__, f.__globals__, None,
+                                        None, f.__closure__)
+            single.__annotations__ = {name: annotation}
+            try:
+                hints.update(typing.get_type_hints(single))
+            except Exception as e:
+                errors[name] = e
+                hints[name] = Any
+    for name, typ in hints.items():
+        if name in errors:
+            continue
+        try:
+            compile_type(typ, sample)
+        except Exception as e:
+            errors[name] = e
+            hints[name] = Any
+    if errors:
+        warnings.warn("The annotations of " + f.__module__ + "."
+                      + f.__qualname__ + " are not checked for "
+                      + ", ".join("'" + name + "' (" + type(e).__name__
+                                  + ": " + str(e) + ")"
+                                  for name, e in errors.items()),
+                      RuntimeWarning, stacklevel=4)
+    return hints
+
+def _annotations_checked(f, sample, strict=True):
+    """Decorate a function with accepts and returns according to its
+    annotations.
+    Parameters:
+        f - function:
+            The function to decorate
+        sample - int or None:
+            The sample size of the decorators
+        strict - bool:
+            If False, the annotations that cannot be resolved or checked are
+            not checked (see _checkable_hints)
+    Returns:
+        function:
+            The decorated function
+    """
+    hints = _type_hints(f) if strict else _checkable_hints(f, sample)
+    kwargs_types = {}
+    params = list(inspect.signature(f).parameters.values())
+    for i in range(len(params)):
+        name = params[i].name
+        if name in hints:
+            kwargs_types[name] = hints[name]
+        elif i > 0 or name not in ("self", "cls"):
+            # The parameters without annotation accept anything
+            kwargs_types[name] = Any
+    checked = _accepts_decorator((), kwargs_types, sample)(f)
+    if "return" in hints:
+        typ = hints["return"]
+        # The annotation None is turned into NoneType by get_type_hints
+        checked = returns(None if typ is type(None) else typ,
+                          sample)(checked)
+    return checked
+
+def error_msg(fname, param_idx, expected, actual, surrounding, index=None):
     '''Create a type error message
 
     Parameters:
         param_idx - int:
             The parameter position that raised the error
-        expected - list[type]:
-            The list of expected types
-        actual - list[type]:
-            The list of actual types
+        expected - list[type or str]:
+            The list of expected types (or their names)
+        actual - list[type or str]:
+            The list of actual types (or their names)
         surrounding - (str, str) :
             The left and right surrounding of the type that generated the error
+        index - int or None:
+            The position of the element that generated the error, for the
+            values checked one element at a time (e.g. iterators)
 
     Returns:
         str:
             The error message
     '''
-    expected_str = ', '.join([get_name(x) for x in expected])
-    actual_str = ', '.join([get_name(x) for x in actual])
+    # The types can be given by their name (e.g. the dtype of an array)
+    expected_str = ', '.join([x if isinstance(x, str) else get_name(x)
+                              for x in expected])
+    actual_str = ', '.join([x if isinstance(x, str) else get_name(x)
+                            for x in actual])
     expected_str = surrounding[0] + expected_str + surrounding[1]
     actual_str = surrounding[0] + actual_str + surrounding[1]
-    intro = "Type error on return value of method '" + fname + "' :\n"
-    # If the type check is on the return type
+    target = "return value"
+    # If the type check is not on the return type
     if param_idx != -1:
         if isinstance(param_idx, str):
             param_idx = "'" + param_idx + "'"
-        intro = "Type error on parameter " + str(param_idx) \
-                + " of method '" + fname  + "' :\n"
+        target = "parameter " + str(param_idx)
+    if index is not None:
+        target = "element " + str(index) + " of " + target
+    intro = "Type error on " + target + " of method '" + fname + "' :\n"
     msg = intro + "             Expected :  " + expected_str + "\n" \
                 + "             Have :  ".ljust(25, " ") + actual_str
     return msg